@@ -1,13 +1,15 @@
+import os
+import sys
 import matplotlib.pyplot as plt
 from defines import *
-import csv
+from stats import read_stats, column
 
 def plot_stats(stats, index, name, policy_name='Custom'):
-    util = [stat[index] for stat in stats]
-    num  = [stat[2] for stat in stats]
+    util = column(stats, index)
+    num  = column(stats, 2)
 
-    mean_stat = sum(util) / len(util)
-    mean_num  = sum(num)  / len(num)
+    mean_stat = util.mean()
+    mean_num  = num.mean()
 
     print(f"{name}: NUM:{mean_num}, STAT:{mean_stat}, RATIO:{mean_stat/mean_num}")
     fig = plt.scatter(util, num, s=50, alpha=0.5)
@@ -19,17 +21,23 @@ def plot_stats(stats, index, name, policy_name='Custom'):
     plt.show()
 
 def read_stats_from_file(file):
-    with open(file, newline='') as csvfile:
-        stats = []
-        spamreader = csv.reader(csvfile)
-        for row in spamreader:
-            new_row = [float(element) for element in row]
-            stats.append(new_row)
+    '''
+    .npy stats files are memory mapped, csv ones parsed into an array
+    '''
+    return read_stats(file)
 
-        return stats
+def default_stats_file():
+    '''
+    The stats file app.multiple_runs writes for the custom policy, or the
+    csv one of older runs if there is no .npy one
+    '''
+    from app import stats_file
+    path = stats_file('npy', 'custom')
+    csv_path = stats_file('csv', 'custom')
+    return csv_path if not os.path.exists(path) and os.path.exists(csv_path) else path
     
 if __name__ == '__main__':
-    FILE_NAME = 'out/custom_data.csv'
+    FILE_NAME = sys.argv[1] if len(sys.argv) > 1 else default_stats_file()
 
     stats = read_stats_from_file(FILE_NAME)
 
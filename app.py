@@ -1,79 +1,12 @@
+import argparse
 import random
 import sys
-import matplotlib.pyplot as plt
+import numpy as np
 from base import *
+from instrumentation import *
+from container import Container
 from defines import *
-
-class Container:
-    def __init__(self, width, height):
-        self.width = width
-        self.height = height
-        self.rectangles = []
-
-    def place_rectangle(self, rectangle):
-        if self.width < rectangle.width or self.height < rectangle.height:
-            return False  # Rectangle is too large to fit
-
-        x, y = self.policy(rectangle)
-
-        if x is None or y is None:
-            return False
-        
-        if x + rectangle.width > self.width or \
-            y + rectangle.height > self.height:
-            return False  # Rectangle is too wide to fit
-        
-        self.rectangles.append(Rectangle(x, y, rectangle.width, rectangle.height))
-        return True
-
-    def visualize(self):
-        fig, ax = plt.subplots()
-
-        # Draw container
-        ax.add_patch(plt.Rectangle((0, 0), self.width, self.height, linewidth=1, edgecolor='black', facecolor='none'))
-
-        # Draw rectangles
-        for i,rect in enumerate(self.rectangles):
-            ax.add_patch(plt.Rectangle((rect.x, rect.y), rect.width, rect.height, linewidth=1, edgecolor='black', facecolor=(float(i/len(self.rectangles)),0,0)))
-
-        # Set axis limits
-        ax.set_xlim([0, self.width])
-        ax.set_ylim([0, self.height])
-
-        # Show plot
-        plt.show()
-
-    def generate_frames(self):
-        '''
-        Generates an image everytime a rect is placed
-        '''
-        for i in range(len(self.rectangles)):
-            fig, ax = plt.subplots()
-
-            # Draw container
-            ax.add_patch(plt.Rectangle((0, 0), self.width, self.height, linewidth=1, edgecolor='black', facecolor='none'))
-
-            # Draw rectangles
-            for i,rect in enumerate(self.rectangles[0:i]):
-                ax.add_patch(plt.Rectangle((rect.x, rect.y), rect.width, rect.height, linewidth=1, edgecolor='black', facecolor=(float(i/len(self.rectangles)),0,0)))
-
-            # Set axis limits
-            ax.set_xlim([0, self.width])
-            ax.set_ylim([0, self.height])
-
-            # Save frame
-            plt.savefig(f"out/frames/frame_{i}.png")
-
-    def calculate_utilization(self):
-        used_area = 0
-        for rectangle in self.rectangles:
-            used_area += rectangle.width * rectangle.height
-        total_area = self.width * self.height
-        utilization_percentage = (used_area / total_area) * 100
-
-        self.utilization_percentage = utilization_percentage
-        self.num_of_placed_rect = len(self.rectangles)
-        print(f"Num={self.num_of_placed_rect}, {utilization_percentage=}")
+from policies import POLICIES, get_policy
 
 def generate_random_rectangles(num_rectangles, min_width, max_width, min_height, max_height):
     rectangles = []
@@ -89,11 +22,39 @@ def set_seed(s=None):
     print("Seed is :", seed)
     return seed
 
-def run(visualize=True, seed=None):
+def resolve_policy(policy=None):
+    '''
+    Policy class from a class or a name in policies.POLICIES, the
+    placement_policy of defines.py by default
+    '''
+    policy = placement_policy if policy is None else policy
+    return get_policy(policy) if isinstance(policy, str) else policy
+
+def workload_rectangles(sizes):
+    '''
+    Iterates an (n, 2) array of widths and heights as Rectangles, reusing
+    one Rectangle
+    '''
+    probe = Rectangle(0, 0, 0, 0)
+    for width, height in sizes.tolist():
+        probe.width, probe.height = width, height
+        yield probe
+
+def run(visualize=True, seed=None, timing=False, policy=None,
+        width=container_width, height=container_height, num=num_rectangles, policy_kwargs=None, rectangles=None):
+    '''
+    rectangles is a prepared workload (Rectangles or an (n, 2) array of
+    sizes, see workloads.py) packed instead of num random rects
+    '''
     SEED = set_seed(seed)
 
-    container = placement_policy(container_width, container_height)
-    rectangles = generate_random_rectangles(num_rectangles, min_rect_width, max_rect_width, min_rect_height, max_rect_height)
+    policy = resolve_policy(policy)
+    instrumentation = Instrumentation(timing=timing)
+    container = policy(width, height, instrumentation=instrumentation, **(policy_kwargs or {}))
+    if rectangles is None:
+        rectangles = generate_random_rectangles(num, min_rect_width, max_rect_width, min_rect_height, max_rect_height)
+    elif isinstance(rectangles, np.ndarray):
+        rectangles = workload_rectangles(rectangles)
     
     strike_one = True
     for rect in rectangles:
@@ -109,20 +70,18 @@ def run(visualize=True, seed=None):
             strike_one = False
 
     container.calculate_utilization()
+    report = container.verify()
+    if not report.ok:
+        print(f"Invalid layout - {len(report.overlaps)} overlapping pairs, {len(report.out_of_bounds)} out of bounds")
     if visualize is True:
         container.visualize()
-    try:
-        print(container.perf_counters)
-        perf_counters = [container.perf_counters['EQUIFILL']['ADD_AND_COMP'],
-                        container.perf_counters['ALTERNATE']['ADD_AND_COMP'],
-                        container.perf_counters['ALTERNATE']['MAX_OPERATION'], 
-                        container.perf_counters['ALTERNATE']['INITIATED']]
-
-        return [SEED, container.utilization_percentage, container.num_of_placed_rect] + perf_counters
-    except AttributeError:
-        return [SEED, container.utilization_percentage, container.num_of_placed_rect]
-
-def plot_stats(stats):
+    stats = instrumentation.export(container.stat_counters, container.stat_phases)
+    invalid = len(report.overlaps) + len(report.out_of_bounds)
+    return [SEED, container.utilization_percentage, container.num_of_placed_rect] + stats + [invalid]
+
+def plot_stats(stats, policy=None):
+    import matplotlib.pyplot as plt
+    policy = resolve_policy(policy)
     util = [stat[1] for stat in stats]
     num  = [stat[2] for stat in stats]
 
@@ -131,32 +90,159 @@ def plot_stats(stats):
 
     fig = plt.scatter(util, num, s=50, alpha=0.5)
     fig = plt.scatter([mean_util], [mean_num], s=50, alpha=0.5, color='red')
-    plt.title(f"{placement_policy.name}")
+    plt.title(f"{policy.name}")
     plt.xlabel("utilization")
     plt.ylabel("Num of rectangles")
-    plt.savefig(f"out/{placement_policy.name}_plot.png")
+    plt.savefig(f"out/{policy.name}_plot.png")
     plt.show()
 
-def dump_stats(stats):
-    import csv
-    with open(f"out/{placement_policy.name}_data.csv", "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerows(stats)
-
-def multiple_runs(NUM_RUNS=None):
+def stat_columns(timing=False, policy=None):
+    '''
+    Names of the columns of the stat rows returned by run()
+    '''
+    policy = resolve_policy(policy)
+    instrumentation = Instrumentation(timing=timing)
+    counters = instrumentation.column_names(policy.stat_counters, policy.stat_phases)
+    # invalid: overlapping pairs and out of bounds placements of the layout
+    return ['seed', 'util', 'num'] + counters + ['invalid']
+
+def stats_file(file_format='npy', policy=None):
+    return f"out/{resolve_policy(policy).name}_data.{file_format}"
+
+def dump_stats(stats, path=None, policy=None, timing=False):
+    '''
+    Writes the stat rows (of runs made with the given timing) to a .npy
+    (binary) or .csv file
+    '''
+    from stats import open_stats_writer
+    columns = stat_columns(timing=timing, policy=policy)
+    with open_stats_writer(path or stats_file(policy=policy), columns) as writer:
+        for stat in stats:
+            writer.write(stat)
+
+def derive_seeds(master_seed, num_runs):
+    '''
+    Derives the seed of every run from the master seed, so that each run
+    has its own random stream independent of the process that executes it
+    '''
+    rng = random.Random(master_seed)
+    return [rng.randrange(sys.maxsize) for _ in range(num_runs)]
+
+def run_all(seeds, workers=None, workloads=None, **run_kwargs):
+    '''
+    Yields (run index, stat) in run order. Runs are spread over a
+    process pool of `workers` processes (all cores by default), or run
+    serially in this process when workers is 1. run_kwargs are passed to
+    every run, and run i packs workloads[i] if given
+    '''
+    def kwargs(i):
+        if workloads is None:
+            return run_kwargs
+        return dict(run_kwargs, rectangles=np.array(workloads[i]))
+
+    if workers == 1:
+        for i, seed in enumerate(seeds):
+            yield i, run(visualize=False, seed=seed, **kwargs(i))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run, False, seed, **kwargs(i)) for i, seed in enumerate(seeds)]
+        # in submission order, so the output is the same as a serial one
+        for i, future in enumerate(futures):
+            yield i, future.result()
+
+def multiple_runs(NUM_RUNS=None, master_seed=None, workers=None, path=None, policy=None, plot=True,
+                  workload=None, **run_kwargs):
+    '''
+    Every run is seeded from the master seed, so the stats are the same
+    for any number of workers. Stat rows are written to the stats file
+    (out/<policy>_data.npy by default) in run order, as soon as all the
+    earlier runs are done.
+    With workload (a distribution of workloads.DISTRIBUTIONS) the rects of
+    the runs are read from the workload store instead of being generated
+    by every run, so all policies pack the same ones
+    '''
+    from stats import open_stats_writer
+    policy = resolve_policy(policy)
     iter = NUM_RUNS if NUM_RUNS is not None else ITERATIONS
-    stats = []
-
-    for i in range(iter):
-        stat = run(visualize=False)
-        stats.append(stat)
+    master_seed = random.randrange(sys.maxsize) if master_seed is None else master_seed
+    print("Master seed is :", master_seed)
+
+    workloads = None
+    if workload is not None:
+        from workloads import WorkloadStore
+        bounds = (min_rect_width, max_rect_width, min_rect_height, max_rect_height)
+        workloads = WorkloadStore().get(iter, run_kwargs.get('num', num_rectangles), workload, bounds, master_seed)
+
+    stats = [None] * iter
+    columns = stat_columns(timing=run_kwargs.get('timing', False), policy=policy)
+    with open_stats_writer(path or stats_file(policy=policy), columns) as writer:
+        for i, stat in run_all(derive_seeds(master_seed, iter), workers, workloads, policy=policy, **run_kwargs):
+            stats[i] = stat
+            writer.write(stat)
     
     stats.sort(key=lambda x: x[1], reverse=True)
 
     print(stats)
-    plot_stats(stats)
-    dump_stats(stats)
+    num_invalid = sum(stat[-1] > 0 for stat in stats)
+    if num_invalid:
+        print(f"{num_invalid} of {iter} runs made an invalid layout")
+    if plot:
+        plot_stats(stats, policy)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Packs random rectangles into a container with a placement policy")
+    parser.add_argument('--policy', default=placement_policy, choices=sorted(POLICIES))
+    parser.add_argument('--width', type=int, default=container_width)
+    parser.add_argument('--height', type=int, default=container_height)
+    parser.add_argument('--iterations', type=int, default=ITERATIONS,
+                        help="number of runs, the most runs with --target-ci or --compare")
+    parser.add_argument('--num-rectangles', type=int, default=num_rectangles, help="rectangles generated per run")
+    parser.add_argument('--seed', type=int, help="master seed of the runs, or the seed of the --visualize run")
+    parser.add_argument('--workers', type=int, help="worker processes, all cores by default")
+    parser.add_argument('--output', help="stats file, out/<policy>_data.npy by default")
+    parser.add_argument('--layout', help="lane layout file for the custom policy, see layout_search.py")
+    parser.add_argument('--visualize', action='store_true', help="make a single run and plot the layout")
+    parser.add_argument('--no-plot', action='store_true', help="do not plot the stats of the runs")
+    parser.add_argument('--target-ci', type=float,
+                        help="run until the 95%% confidence interval of the mean utilization is within +-this")
+    parser.add_argument('--compare', choices=sorted(POLICIES),
+                        help="paired same-seed comparison with this policy, until the difference is significant")
+    parser.add_argument('--workload', choices=['uniform', 'normal', 'exponential'],
+                        help="pack stored workloads of this size distribution (see workloads.py)")
+    args = parser.parse_args(argv)
+
+    policy = get_policy(args.policy)
+    run_kwargs = dict(width=args.width, height=args.height, num=args.num_rectangles)
+    if args.layout:
+        if args.policy != 'custom':
+            parser.error("--layout only applies to the custom policy")
+        if args.compare:
+            parser.error("--layout cannot be combined with --compare")
+        run_kwargs['policy_kwargs'] = {'layout_file': args.layout}
+    if args.visualize:
+        return run(visualize=True, seed=args.seed, policy=policy, **run_kwargs)
+
+    if args.compare or args.target_ci is not None:
+        if args.workload:
+            parser.error("--workload cannot be combined with --compare or --target-ci")
+        import evaluation
+        master_seed = random.randrange(sys.maxsize) if args.seed is None else args.seed
+        print("Master seed is :", master_seed)
+        if args.compare:
+            return evaluation.compare_policies(policy, get_policy(args.compare), max_runs=args.iterations,
+                                               master_seed=master_seed, workers=args.workers, **run_kwargs)
+        stats, _, _ = evaluation.sequential_runs(policy, args.target_ci, max_runs=args.iterations,
+                                                 master_seed=master_seed, workers=args.workers, **run_kwargs)
+        dump_stats(stats, args.output, policy, run_kwargs.get('timing', False))
+        if not args.no_plot:
+            plot_stats(stats, policy)
+        return stats
+    return multiple_runs(args.iterations, args.seed, args.workers, args.output, policy, not args.no_plot,
+                         args.workload, **run_kwargs)
 
 if __name__ == '__main__':
     # run(visualize=True, seed=8027613686809405079)
-    multiple_runs()
\ No newline at end of file
+    main()
@@ -1,4 +1,8 @@
+import numpy as np
+
 class Rectangle:
+    __slots__ = ('x', 'y', 'width', 'height')
+
     def __init__(self, x, y, width, height):
         self.x = x
         self.y = y
@@ -9,4 +13,313 @@ class Rectangle:
         return not (self.x + self.width <= other.x or
                     self.y + self.height <= other.y or
                     self.x >= other.x + other.width or
-                    self.y >= other.y + other.height)
\ No newline at end of file
+                    self.y >= other.y + other.height)
+
+def rectangle_sizes(rectangles):
+    '''
+    (n, 2) int64 array of the widths and heights of a sequence of
+    Rectangles or of an array of sizes
+    '''
+    if isinstance(rectangles, np.ndarray):
+        return np.ascontiguousarray(rectangles.reshape(-1, 2), dtype=np.int64)
+    return np.array([(r.width, r.height) for r in rectangles], dtype=np.int64).reshape(-1, 2)
+
+class PlacementStore:
+    '''
+    Placed rectangles stored as growable x, y, width and height int arrays.
+    Indexing and iterating give Rectangle views, so the store can be used
+    where a list of rectangles was used before. Every placement also gets
+    an id, kept when a removal moves it to another index
+    '''
+    def __init__(self, capacity=64):
+        self.data = np.empty((4, capacity), dtype=np.int32)
+        self.id_data = np.empty(capacity, dtype=np.int64)
+        self.next_id = 0
+        self.size = 0
+        # changes on every add or removal, for the caches of the placements
+        self.version = 0
+
+    @property
+    def x(self):
+        return self.data[0, :self.size]
+
+    @property
+    def y(self):
+        return self.data[1, :self.size]
+
+    @property
+    def width(self):
+        return self.data[2, :self.size]
+
+    @property
+    def height(self):
+        return self.data[3, :self.size]
+
+    @property
+    def ids(self):
+        return self.id_data[:self.size]
+
+    def reserve(self, capacity):
+        if capacity > self.data.shape[1]:
+            # grow geometrically so appends are amortized O(1)
+            data = np.empty((4, max(capacity, 2*self.data.shape[1])), dtype=self.data.dtype)
+            data[:, :self.size] = self.data[:, :self.size]
+            self.data = data
+            id_data = np.empty(data.shape[1], dtype=np.int64)
+            id_data[:self.size] = self.id_data[:self.size]
+            self.id_data = id_data
+
+    def add(self, x, y, width, height, placement_id=None):
+        '''
+        Appends a rectangle, with a new id unless one is given. Returns
+        its id
+        '''
+        if self.size == self.data.shape[1]:
+            self.reserve(self.size + 1)
+        if placement_id is None:
+            placement_id = self.next_id
+            self.next_id += 1
+        self.data[:, self.size] = (x, y, width, height)
+        self.id_data[self.size] = placement_id
+        self.size += 1
+        self.version += 1
+        return placement_id
+
+    def append(self, rectangle):
+        self.add(rectangle.x, rectangle.y, rectangle.width, rectangle.height)
+
+    def truncate(self, size):
+        '''
+        Drops the rectangles placed after the first size ones
+        '''
+        self.size = min(self.size, size)
+        self.version += 1
+
+    def remove(self, index):
+        '''
+        Removes the index-th rectangle, moving the last one to its index.
+        Returns the removed (x, y, width, height)
+        '''
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("placement index out of range")
+        removed = tuple(self.data[:, index].tolist())
+        self.size -= 1
+        self.data[:, index] = self.data[:, self.size]
+        self.id_data[index] = self.id_data[self.size]
+        self.version += 1
+        return removed
+
+    def restore(self, index, x, y, width, height, placement_id):
+        '''
+        Undoes remove(index) of the rectangle (x, y, width, height) with
+        the given id
+        '''
+        if index < self.size:
+            # the rectangle that was moved to index goes back to the end
+            self.add(*self.data[:, index].tolist(), placement_id=int(self.id_data[index]))
+            self.data[:, index] = (x, y, width, height)
+            self.id_data[index] = placement_id
+            self.version += 1
+        else:
+            self.add(x, y, width, height, placement_id)
+
+    def index_of(self, placement_id):
+        '''
+        Current index of the placement with the given id, in O(n)
+        '''
+        found = np.flatnonzero(self.ids == placement_id)
+        if len(found) == 0:
+            raise KeyError(f"no placement with id {placement_id}")
+        return int(found[0])
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Rectangle(*rect) for rect in self.data[:, :self.size][:, index].T.tolist()]
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("placement index out of range")
+        return Rectangle(*self.data[:, index].tolist())
+
+    def __iter__(self):
+        for rect in self.data[:, :self.size].T.tolist():
+            yield Rectangle(*rect)
+
+    def used_area(self):
+        return int(np.dot(self.width.astype(np.int64), self.height))
+
+    def bounding_box(self):
+        '''
+        Returns the max x and max y reached by the placed rectangles
+        '''
+        if self.size == 0:
+            return 0, 0
+        return int((self.x + self.width).max()), int((self.y + self.height).max())
+
+    def intersects(self, x, y, width, height):
+        '''
+        Returns a bool array telling which placed rectangles intersect
+        the rectangle at (x, y) of size width x height
+        '''
+        return ~((x + width <= self.x) | (y + height <= self.y) |
+                 (x >= self.x + self.width) | (y >= self.y + self.height))
+
+class MaxSegmentTree:
+    '''
+    Growable segment tree over a sequence of values. Every node keeps the
+    max of its subtree, so the leftmost value above a threshold is found
+    in O(log n) by a single descent from the root
+    '''
+    EMPTY = float('-inf')
+
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self.size = 0
+        self.tree = [self.EMPTY] * (2*capacity)
+
+    @classmethod
+    def filled(cls, size, value):
+        '''
+        Tree of size values all equal to value
+        '''
+        capacity = 16
+        while capacity < size:
+            capacity *= 2
+        tree = cls(capacity)
+        tree.size = size
+        tree.tree[capacity:capacity+size] = [value] * size
+        for node in range(capacity-1, 0, -1):
+            tree.tree[node] = max(tree.tree[2*node], tree.tree[2*node+1])
+        return tree
+
+    def __len__(self):
+        return self.size
+
+    def grow(self):
+        capacity = 2*self.capacity
+        tree = [self.EMPTY] * (2*capacity)
+        tree[capacity:capacity+self.size] = self.tree[self.capacity:self.capacity+self.size]
+        for node in range(capacity-1, 0, -1):
+            tree[node] = max(tree[2*node], tree[2*node+1])
+        self.tree, self.capacity = tree, capacity
+
+    def append(self, value):
+        if self.size == self.capacity:
+            self.grow()
+        self.size += 1
+        self.update(self.size - 1, value)
+
+    def pop(self):
+        value = self[self.size - 1]
+        self.update(self.size - 1, self.EMPTY)
+        self.size -= 1
+        return value
+
+    def update(self, index, value):
+        tree = self.tree
+        node = index + self.capacity
+        tree[node] = value
+        node >>= 1
+        while node:
+            top = max(tree[2*node], tree[2*node+1])
+            if tree[node] == top:
+                break  # the ancestors do not change either
+            tree[node] = top
+            node >>= 1
+
+    def assign(self, lo, hi, value):
+        '''
+        Sets the values of [lo, hi) to value, in O(hi - lo + log n)
+        '''
+        tree = self.tree
+        lo, hi = lo + self.capacity, hi + self.capacity
+        tree[lo:hi] = [value] * (hi - lo)
+        lo, hi = lo >> 1, (hi - 1) >> 1
+        while lo:
+            for node in range(lo, hi + 1):
+                tree[node] = max(tree[2*node], tree[2*node+1])
+            lo, hi = lo >> 1, hi >> 1
+
+    def __getitem__(self, index):
+        return self.tree[index + self.capacity]
+
+    def max(self):
+        return self.tree[1]
+
+    def range_max(self, lo, hi):
+        '''
+        Max of the values of [lo, hi)
+        '''
+        tree = self.tree
+        best = self.EMPTY
+        lo, hi = lo + self.capacity, min(hi, self.size) + self.capacity
+        while lo < hi:
+            if lo & 1:
+                best = max(best, tree[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                best = max(best, tree[hi])
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def rightmost_at_least(self, hi, value):
+        '''
+        Returns the last index before hi of a value >= value, or -1. Climbs
+        from hi, so it costs O(log d) for the index d values away
+        '''
+        if hi <= 0:
+            return -1
+        tree = self.tree
+        node = hi - 1 + self.capacity
+        if tree[node] < value:
+            while True:
+                if node & 1 and tree[node - 1] >= value:
+                    node -= 1
+                    break
+                node >>= 1
+                if node <= 1:
+                    return -1
+        while node < self.capacity:
+            node = 2*node + 1 if tree[2*node + 1] >= value else 2*node
+        return node - self.capacity
+
+    def leftmost_at_least(self, lo, value):
+        '''
+        Returns the first index from lo on of a value >= value, or len(self)
+        '''
+        if lo >= self.size:
+            return self.size
+        tree = self.tree
+        node = lo + self.capacity
+        if tree[node] < value:
+            while True:
+                if node & 1 == 0 and tree[node + 1] >= value:
+                    node += 1
+                    break
+                node >>= 1
+                if node <= 1:
+                    return self.size
+        while node < self.capacity:
+            node = 2*node if tree[2*node] >= value else 2*node + 1
+        index = node - self.capacity
+        return index if index < self.size else self.size
+
+    def leftmost_above(self, threshold):
+        '''
+        Returns the index of the leftmost value strictly greater than
+        threshold, or None
+        '''
+        tree = self.tree
+        if tree[1] <= threshold:
+            return None
+        node = 1
+        while node < self.capacity:
+            node = 2*node if tree[2*node] > threshold else 2*node + 1
+        return node - self.capacity
@@ -0,0 +1,172 @@
+'''
+Placement throughput and latency benchmark for every policy in policies.py.
+
+Sweeps container sizes, rectangle size distributions and rectangle counts
+with fixed seeds and writes the results as JSON, e.g.
+
+    python bench.py --output out/bench.json
+    python bench.py --output new.json --compare out/bench.json
+
+Throughput is reported as attempts_per_s, the rectangles offered per
+second whether they were placed or not, and placed_per_s, the ones placed.
+Every case reports its run of median attempts_per_s over the seeds (its
+'seed' field), and how many of the runs made an invalid layout. --compare
+compares attempts_per_s.
+'''
+import argparse
+import inspect
+import json
+import platform
+import random
+import subprocess
+import time
+
+import policies
+from app import generate_random_rectangles
+from container import Container
+
+CONTAINER_SIZES = [(128, 128), (512, 512)]
+RECT_COUNTS     = [200, 2000]
+# name -> (min width, max width, min height, max height)
+DISTRIBUTIONS   = {'small' : (4, 16, 4, 16),
+                   'wide'  : (16, 64, 4, 16),
+                   'mixed' : (4, 64, 4, 64)}
+SEEDS           = [0, 1, 2]
+# a case stops feeding rectangles once it has spent this long placing them
+CASE_BUDGET_S   = 1.0
+
+def policy_variants():
+    '''
+    Every Container subclass in policies.py, plus the batched randomized search
+    '''
+    variants = []
+    for name, cls in inspect.getmembers(policies, inspect.isclass):
+        if issubclass(cls, Container) and cls is not Container and cls.__module__ == policies.__name__:
+            variants.append((name, cls, {}))
+    variants.append(('RandomizedPolicy[batched]', policies.RandomizedPolicy, {'batched': True}))
+    return variants
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(percent / 100 * len(sorted_values)))
+    return sorted_values[index]
+
+def bench_case(cls, kwargs, width, height, rectangles, budget_s=CASE_BUDGET_S):
+    container = cls(width, height, **kwargs)
+    latencies = []
+    placed = 0
+    total_ns = 0
+    budget_ns = budget_s * 1e9
+    clock = time.perf_counter_ns
+    for rect in rectangles:
+        start = clock()
+        is_placed = container.place_rectangle(rect)
+        latency = clock() - start
+        latencies.append(latency)
+        placed += is_placed
+        total_ns += latency
+        if total_ns > budget_ns:
+            break
+
+    latencies.sort()
+    # checked after the clock stops, so it does not count in the timings
+    report = container.verify()
+    return {'attempted'       : len(latencies),
+            'placed'          : placed,
+            'utilization'     : container.rectangles.used_area() / (width * height) * 100,
+            'total_s'         : total_ns / 1e9,
+            'attempts_per_s'  : len(latencies) / (total_ns / 1e9) if total_ns else 0.0,
+            'placed_per_s'    : placed / (total_ns / 1e9) if total_ns else 0.0,
+            'p50_us'          : percentile(latencies, 50) / 1e3,
+            'p99_us'          : percentile(latencies, 99) / 1e3,
+            'valid'           : report.ok}
+
+def run_benchmarks(container_sizes, distributions, rect_counts, seeds, policy_filter=None, budget_s=CASE_BUDGET_S):
+    results = []
+    for label, cls, kwargs in policy_variants():
+        if policy_filter and policy_filter not in label:
+            continue
+        for width, height in container_sizes:
+            for dist_name in distributions:
+                min_w, max_w, min_h, max_h = DISTRIBUTIONS[dist_name]
+                for count in rect_counts:
+                    runs = []
+                    for seed in seeds:
+                        random.seed(seed)
+                        rectangles = generate_random_rectangles(count, min_w, max_w, min_h, max_h)
+                        runs.append(dict(bench_case(cls, kwargs, width, height, rectangles, budget_s), seed=seed))
+
+                    # the run of median throughput, whole, so all its numbers
+                    # come from the same seed
+                    median = sorted(runs, key=lambda run: run['attempts_per_s'])[len(runs)//2]
+                    result = {'policy': label, 'width': width, 'height': height,
+                              'distribution': dist_name, 'count': count, 'seeds': list(seeds),
+                              'invalid': sum(not run['valid'] for run in runs), **median}
+                    results.append(result)
+                    invalid = f"  {result['invalid']} invalid layout(s)" if result['invalid'] else ''
+                    print(f"{label:28} {width}x{height} {dist_name:6} n={count:<6} "
+                          f"{result['attempts_per_s']:12.0f} attempts/s {result['placed_per_s']:12.0f} placed/s "
+                          f"p50={result['p50_us']:9.1f}us "
+                          f"p99={result['p99_us']:9.1f}us{invalid}")
+    return results
+
+def case_key(result):
+    return (result['policy'], result['width'], result['height'], result['distribution'], result['count'])
+
+def compare(results, baseline_file, threshold):
+    '''
+    Prints the attempts_per_s ratio to a previous run and returns the cases
+    that got slower by more than threshold. Older baselines named it
+    placements_per_s
+    '''
+    with open(baseline_file) as f:
+        baseline = {case_key(result): result for result in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        old = baseline.get(case_key(result))
+        old_rate = None if old is None else old.get('attempts_per_s', old.get('placements_per_s'))
+        if not old_rate:
+            continue
+        ratio = result['attempts_per_s'] / old_rate
+        flag = ''
+        if ratio < 1 - threshold:
+            flag = '  <-- REGRESSION'
+            regressions.append(case_key(result))
+        print(f"{' '.join(map(str, case_key(result))):50} {ratio:6.2f}x{flag}")
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='out/bench.json')
+    parser.add_argument('--policy', help="only run the policies whose name contains this")
+    parser.add_argument('--quick', action='store_true', help="smallest container, count and one seed")
+    parser.add_argument('--compare', help="previous bench json to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="slowdown reported as a regression")
+    parser.add_argument('--budget', type=float, default=CASE_BUDGET_S, help="seconds spent placing per case")
+    args = parser.parse_args()
+
+    if args.quick:
+        sweep = ([CONTAINER_SIZES[0]], ['small'], [RECT_COUNTS[0]], SEEDS[:1])
+    else:
+        sweep = (CONTAINER_SIZES, list(DISTRIBUTIONS), RECT_COUNTS, SEEDS)
+    results = run_benchmarks(*sweep, policy_filter=args.policy, budget_s=args.budget)
+
+    with open(args.output, 'w') as f:
+        json.dump({'commit'  : git_commit(),
+                   'python'  : platform.python_version(),
+                   'machine' : platform.machine(),
+                   'time'    : time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'results' : results}, f, indent=1)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} regression(s)")
@@ -0,0 +1,162 @@
+'''
+Content addressed cache of packing results.
+
+A batch is keyed by the cache version, the policy name, its keyword
+arguments, the container dimensions and a hash of the rectangle sizes in
+order, so the same batch is only packed once:
+
+    cache = PackingCache(max_entries=1024, directory='out/pack_cache')
+    xs, ys = cached_pack(cache, SkylinePolicy, 128, 128, rectangles)
+
+Recently used results are kept in memory, and with a directory also as
+.npy files on disk, evicting the least recently used once the files take
+more than max_bytes. Policies that are not deterministic bypass the cache.
+Keyword arguments must be JSON values, and the ones naming a file (like
+the layout_file of CustomPolicy) are keyed by the file content, so editing
+the file does not return the placements of its old content.
+'''
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+
+from base import rectangle_sizes
+
+# changed whenever the policies place differently, so stored results of
+# an older version are never returned
+CACHE_VERSION = 1
+
+# keyword arguments naming a file the policy reads
+FILE_KWARGS = ('layout_file',)
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+def packing_key(policy, width, height, sizes, policy_kwargs=None):
+    kwargs = []
+    for name, value in sorted((policy_kwargs or {}).items()):
+        if name in FILE_KWARGS and value is not None:
+            value = {'file': file_digest(value)}
+        kwargs.append([name, value])
+    header = [CACHE_VERSION, policy.name, width, height, kwargs]
+    try:
+        text = json.dumps(header)
+    except TypeError as e:
+        raise TypeError(f"{policy.name} kwargs cannot be cached, they must be JSON values: {e}") from None
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(text.encode())
+    digest.update(sizes.astype('<i8', copy=False).tobytes())
+    return digest.hexdigest()
+
+class PackingCache:
+    '''
+    Placements (xs, ys) of packed batches, in a memory LRU of max_entries
+    results and optionally in a directory of at most max_bytes
+    '''
+    def __init__(self, max_entries=1024, directory=None, max_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = self.disk_hits = self.misses = 0
+
+        # size of every file on disk, least recently used first
+        self.files = OrderedDict()
+        self.disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            entries = [entry for entry in os.scandir(directory) if entry.name.endswith('.npy')]
+            for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+                self.files[entry.name[:-4]] = entry.stat().st_size
+                self.disk_bytes += entry.stat().st_size
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        '''
+        Returns the stored (xs, ys) or None
+        '''
+        placements = self.memory.get(key)
+        if placements is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return placements
+
+        if key in self.files:
+            try:
+                placements = np.load(self.path(key))
+            except OSError:
+                # removed by another process sharing the directory
+                self.disk_bytes -= self.files.pop(key)
+            else:
+                self.files.move_to_end(key)
+                os.utime(self.path(key))
+                placements.setflags(write=False)
+                self.remember(key, placements)
+                self.hits += 1
+                self.disk_hits += 1
+                return placements
+
+        self.misses += 1
+        return None
+
+    def put(self, key, placements):
+        placements = np.stack(placements).astype(np.int64)
+        placements.setflags(write=False)
+        self.remember(key, placements)
+        if self.directory is not None and key not in self.files:
+            self.store(key, placements)
+        return placements
+
+    def remember(self, key, placements):
+        self.memory[key] = placements
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def store(self, key, placements):
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, placements)
+        os.replace(tmp_path, path)
+
+        size = os.path.getsize(path)
+        self.files[key] = size
+        self.disk_bytes += size
+        while self.disk_bytes > self.max_bytes and len(self.files) > 1:
+            old_key, old_size = self.files.popitem(last=False)
+            self.disk_bytes -= old_size
+            try:
+                os.remove(self.path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        self.memory.clear()
+        for key in self.files:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+        self.files.clear()
+        self.disk_bytes = 0
+
+def cached_pack(cache, policy, width, height, rectangles, **policy_kwargs):
+    '''
+    Container.pack_all of a fresh container of the policy, through the
+    cache. Returns the read only x and y arrays, -1 where a rectangle
+    could not be placed
+    '''
+    sizes = rectangle_sizes(rectangles)
+    if not policy.deterministic:
+        return policy(width, height, **policy_kwargs).pack_all(sizes)
+
+    key = packing_key(policy, width, height, sizes, policy_kwargs)
+    placements = cache.get(key)
+    if placements is None:
+        placements = cache.put(key, policy(width, height, **policy_kwargs).pack_all(sizes))
+    return placements[0], placements[1]
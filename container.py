@@ -0,0 +1,221 @@
+'''
+The packing core: a Container holds the placed rectangles and places new
+ones at the position given by its policy (see policies.py). Plotting is
+imported only when a container is visualized, so packing does not pay for
+matplotlib.
+'''
+import time
+import numpy as np
+from base import *
+from instrumentation import NULL_INSTRUMENTATION
+
+class UnsupportedOperation(TypeError):
+    '''
+    The policy of the container does not support the operation
+    '''
+
+class Container:
+    # pack_all sorts the batch by non-increasing height first
+    presort = False
+    # the policy only returns positions inside the container
+    policy_in_bounds = False
+    # the same batch always gets the same placements (see cache.py)
+    deterministic = True
+    # placements can be removed and their space reused (see remove)
+    supports_removal = False
+    # instrumentation counters and phases exported to the stats csv
+    stat_counters = []
+    stat_phases   = []
+
+    def __init__(self, width, height, instrumentation=None):
+        self.width = width
+        self.height = height
+        self.rectangles = PlacementStore()
+        self.instrumentation = NULL_INSTRUMENTATION if instrumentation is None else instrumentation
+        # (undo function, args) records since the first checkpoint, None when
+        # no checkpoint is open
+        self.undo_log = None
+
+    def place_rectangle(self, rectangle):
+        if rectangle.width <= 0 or rectangle.height <= 0:
+            return False  # Rectangle has no area
+        if self.width < rectangle.width or self.height < rectangle.height:
+            return False  # Rectangle is too large to fit
+
+        x, y = self.timed_policy(rectangle)
+
+        if x is None or y is None:
+            return False
+        
+        if x + rectangle.width > self.width or \
+            y + rectangle.height > self.height:
+            return False  # Rectangle is too wide to fit
+        
+        self.rectangles.add(x, y, rectangle.width, rectangle.height)
+        if self.undo_log is not None:
+            self.log_undo(self.rectangles.truncate, len(self.rectangles) - 1)
+        return True
+
+    def place(self, rectangle):
+        '''
+        Places the rectangle as place_rectangle does. Returns the id of the
+        placement, which stays the same until it is removed, or None if
+        the rectangle could not be placed
+        '''
+        if not self.place_rectangle(rectangle):
+            return None
+        return int(self.rectangles.ids[-1])
+
+    def remove(self, placement_id):
+        '''
+        Removes the placement with the given id (see place, or
+        rectangles.ids for the placements of pack_all) and frees its space
+        for the next placements. The ids of the other placements do not
+        change, but the last placement takes the removed one's index.
+        Returns the removed Rectangle.
+        Only the policies with supports_removal (random and maxrects) can
+        reuse the space; the others raise UnsupportedOperation
+        '''
+        if not self.supports_removal:
+            raise UnsupportedOperation(f"{type(self).__name__} cannot remove placements")
+        index = self.rectangles.index_of(placement_id)
+        x, y, width, height = self.rectangles.remove(index)
+        if self.undo_log is not None:
+            self.log_undo(self.rectangles.restore, index, x, y, width, height, placement_id)
+        self.free_space(x, y, width, height)
+        return Rectangle(x, y, width, height)
+
+    def free_space(self, x, y, width, height):
+        '''
+        Called by remove once the rect at (x, y) is removed, for policies
+        that keep track of the free space
+        '''
+        pass
+
+    def checkpoint(self):
+        '''
+        Returns a mark of the current state to rollback to. From the first
+        checkpoint on, every change to the placements and the policy state
+        is recorded in an undo log, so a checkpoint is O(1) and a rollback
+        costs as much as the changes it undoes. Checkpoints nest: any mark
+        taken since the last commit can be rolled back to. Instrumentation
+        counters, random draws and the next placement id are not rewound
+        '''
+        if self.undo_log is None:
+            self.undo_log = []
+        return len(self.undo_log)
+
+    def rollback(self, mark):
+        '''
+        Restores the state of the checkpoint that returned mark
+        '''
+        undo_log = self.undo_log
+        if undo_log is None or mark > len(undo_log):
+            raise ValueError("rollback to a mark that is not checkpointed")
+        while len(undo_log) > mark:
+            undo, args = undo_log.pop()
+            undo(*args)
+
+    def commit(self):
+        '''
+        Keeps the current state, drops the undo log and the open checkpoints
+        '''
+        self.undo_log = None
+
+    def log_undo(self, undo, *args):
+        '''
+        Records that undo(*args) reverts a change, while checkpointing
+        '''
+        self.undo_log.append((undo, args))
+
+    def timed_policy(self, rectangle):
+        if not self.instrumentation.timing:
+            return self.policy(rectangle)
+        start = time.perf_counter_ns()
+        position = self.policy(rectangle)
+        self.instrumentation.record_latency(time.perf_counter_ns() - start)
+        return position
+
+    def pack_all(self, rectangles):
+        '''
+        Places a whole batch in a single pass. rectangles is a sequence of
+        Rectangles or an (n, 2) array of widths and heights. Returns the x
+        and y arrays of the placements in input order, -1 where a rectangle
+        could not be placed or has no area
+        '''
+        sizes = rectangle_sizes(rectangles)
+        num = len(sizes)
+        xs = np.full(num, -1, dtype=np.int64)
+        ys = np.full(num, -1, dtype=np.int64)
+
+        if self.presort:
+            order = np.argsort(-sizes[:, 1], kind='stable').tolist()
+        else:
+            order = range(num)
+        widths, heights = sizes[:, 0].tolist(), sizes[:, 1].tolist()
+
+        # the policies only read the size, so one rectangle is reused
+        probe = Rectangle(0, 0, 0, 0)
+        check_bounds = not self.policy_in_bounds
+        policy = self.timed_policy if self.instrumentation.timing else self.policy
+        if self.undo_log is not None:
+            # the batch only appends placements
+            self.log_undo(self.rectangles.truncate, len(self.rectangles))
+        self.rectangles.reserve(len(self.rectangles) + num)
+        for i in order:
+            probe.width, probe.height = widths[i], heights[i]
+            if probe.width <= 0 or probe.height <= 0:
+                continue
+            x, y = policy(probe)
+            if x is None or y is None:
+                continue
+            if check_bounds and (x + probe.width > self.width or y + probe.height > self.height):
+                continue
+            xs[i], ys[i] = x, y
+            self.rectangles.add(x, y, probe.width, probe.height)
+        return xs, ys
+
+    def visualize(self):
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots()
+
+        # Draw container
+        ax.add_patch(plt.Rectangle((0, 0), self.width, self.height, linewidth=1, edgecolor='black', facecolor='none'))
+
+        # Draw rectangles
+        for i,rect in enumerate(self.rectangles):
+            ax.add_patch(plt.Rectangle((rect.x, rect.y), rect.width, rect.height, linewidth=1, edgecolor='black', facecolor=(float(i/len(self.rectangles)),0,0)))
+
+        # Set axis limits
+        ax.set_xlim([0, self.width])
+        ax.set_ylim([0, self.height])
+
+        # Show plot
+        plt.show()
+
+    def generate_frames(self, path="out/frames", every=1, scale=4):
+        '''
+        Generates an image everytime a rect is placed (or every `every` rects),
+        showing all the rects placed so far. A path ending in .gif gives a
+        single animated file, otherwise a directory of PNG frames
+        '''
+        from render import render_frames
+        return render_frames(self.width, self.height, self.rectangles, path, every, scale)
+
+    def verify(self):
+        '''
+        Returns a verify.LayoutReport of the overlapping and out of
+        bounds placements, found in O(n log n)
+        '''
+        from verify import verify_layout
+        store = self.rectangles
+        return verify_layout(self.width, self.height, store.x, store.y, store.width, store.height)
+
+    def calculate_utilization(self):
+        used_area = self.rectangles.used_area()
+        total_area = self.width * self.height
+        utilization_percentage = (used_area / total_area) * 100
+
+        self.utilization_percentage = utilization_percentage
+        self.num_of_placed_rect = len(self.rectangles)
+        print(f"Num={self.num_of_placed_rect}, {utilization_percentage=}")
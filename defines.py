@@ -1,6 +1,5 @@
-from policies import *
-
-placement_policy =  CustomPolicy
+# name of a policy in policies.POLICIES
+placement_policy = "custom"
 
 container_width, container_height  = 128, 128
 
@@ -0,0 +1,127 @@
+'''
+Sequential Monte Carlo evaluation of the policies: runs are made in
+batches until the confidence interval of the mean is as narrow as asked,
+instead of a fixed number of runs.
+
+    python app.py --policy ffdh --target-ci 0.25 --iterations 10000
+    python app.py --policy skyline --compare ffdh --iterations 10000
+
+Every batch is checked, so the intervals are looked at many times; the
+default confidence of the comparison is kept high for that reason.
+'''
+import functools
+import math
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+from app import derive_seeds, resolve_policy, run
+
+class RunningStats:
+    '''
+    Running mean and variance (Welford's algorithm)
+    '''
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.inf
+
+    def half_width(self, confidence=0.95):
+        '''
+        Half width of the normal confidence interval of the mean
+        '''
+        if self.count < 2:
+            return math.inf
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        return z * math.sqrt(self.variance / self.count)
+
+    def __repr__(self):
+        return f"{self.mean:.4f} +- {self.half_width():.4f} (n={self.count})"
+
+def paired_run(seed, policies, run_kwargs):
+    '''
+    Runs the same workload (same seed) with every policy
+    '''
+    return [run(False, seed, policy=policy, **run_kwargs) for policy in policies]
+
+def batches(task, seeds, batch_size, workers):
+    '''
+    Yields the results of task(seed) a batch of seeds at a time, in seed
+    order, from one process pool kept over all the batches
+    '''
+    if workers == 1:
+        for start in range(0, len(seeds), batch_size):
+            yield [task(seed) for seed in seeds[start:start + batch_size]]
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(seeds), batch_size):
+            yield list(pool.map(task, seeds[start:start + batch_size]))
+
+def sequential_runs(policy=None, util_half_width=0.25, num_half_width=None, confidence=0.95,
+                    min_runs=30, max_runs=10000, batch_size=32, master_seed=0, workers=None, **run_kwargs):
+    '''
+    Makes runs until the confidence interval of the mean utilization (in
+    percent) is within +-util_half_width, and that of the number of placed
+    rects within +-num_half_width if given, or max_runs are made.
+    Returns the stat rows and the RunningStats of utilization and number
+    '''
+    policy = resolve_policy(policy)
+    seeds = derive_seeds(master_seed, max_runs)
+    task = functools.partial(run, False, policy=policy, **run_kwargs)
+    util, num = RunningStats(), RunningStats()
+
+    stats = []
+    for batch in batches(task, seeds, batch_size, workers):
+        for stat in batch:
+            stats.append(stat)
+            util.add(stat[1])
+            num.add(stat[2])
+        if util.count >= min_runs and util.half_width(confidence) <= util_half_width and \
+                (num_half_width is None or num.half_width(confidence) <= num_half_width):
+            break
+
+    print(f"{policy.name}: util {util}, num {num}")
+    return stats, util, num
+
+def compare_policies(policy_a, policy_b, equivalence=0.1, confidence=0.99,
+                     min_runs=30, max_runs=10000, batch_size=32, master_seed=0, workers=None, **run_kwargs):
+    '''
+    Paired comparison of the mean utilization of two policies: every seed
+    is run with both, and the runs stop once the confidence interval of
+    the mean difference excludes 0 (significant), or is within
+    +-equivalence (no difference that matters), or after max_runs.
+    Returns 'a', 'b' or None for the better policy, and the RunningStats
+    of the difference a - b
+    '''
+    policies = [resolve_policy(policy_a), resolve_policy(policy_b)]
+    seeds = derive_seeds(master_seed, max_runs)
+    task = functools.partial(paired_run, policies=policies, run_kwargs=run_kwargs)
+    diff = RunningStats()
+
+    for batch in batches(task, seeds, batch_size, workers):
+        for stat_a, stat_b in batch:
+            diff.add(stat_a[1] - stat_b[1])
+        if diff.count < min_runs:
+            continue
+        half_width = diff.half_width(confidence)
+        if abs(diff.mean) > half_width or half_width <= equivalence:
+            break
+
+    half_width = diff.half_width(confidence)
+    better = None
+    if abs(diff.mean) > half_width:
+        better = 'a' if diff.mean > 0 else 'b'
+    name_a, name_b = policies[0].name, policies[1].name
+    verdict = {'a': f"{name_a} is better", 'b': f"{name_b} is better", None: "no significant difference"}[better]
+    print(f"{name_a} - {name_b}: util {diff}: {verdict}")
+    return better, diff
@@ -0,0 +1,102 @@
+import time
+from collections import defaultdict
+
+class Instrumentation:
+    '''
+    Named counters, per-phase timers and a per-placement latency histogram,
+    shared by all the policies through Container.instrumentation.
+    Counters are always kept; phase timers and latencies only with
+    timing=True, so that the exported counters stay reproducible
+    '''
+    enabled = True
+    clock = staticmethod(time.perf_counter_ns)
+
+    def __init__(self, timing=False):
+        self.timing = timing
+        self.counters = defaultdict(int)
+        self.phase_ns = defaultdict(int)
+        self.phase_calls = defaultdict(int)
+        # latency histogram with 4 buckets per power of two nanoseconds
+        self.latency_buckets = defaultdict(int)
+        self.num_latencies = 0
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def phase_time(self, name, ns):
+        self.phase_ns[name] += ns
+        self.phase_calls[name] += 1
+
+    def record_latency(self, ns):
+        self.latency_buckets[self.latency_bucket(ns)] += 1
+        self.num_latencies += 1
+
+    @staticmethod
+    def latency_bucket(ns):
+        if ns < 8:
+            return ns
+        shift = ns.bit_length() - 3
+        return 4*shift + (ns >> shift)
+
+    @staticmethod
+    def bucket_upper_bound(bucket):
+        if bucket < 8:
+            return bucket
+        shift, top = bucket//4 - 1, bucket%4 + 4
+        return ((top + 1) << shift) - 1
+
+    def latency_percentile(self, percent):
+        '''
+        Upper bound of the bucket holding the given percentile, in ns
+        '''
+        if self.num_latencies == 0:
+            return 0
+        rank = percent / 100 * self.num_latencies
+        seen = 0
+        for bucket in sorted(self.latency_buckets):
+            seen += self.latency_buckets[bucket]
+            if seen >= rank:
+                return self.bucket_upper_bound(bucket)
+        return self.bucket_upper_bound(max(self.latency_buckets))
+
+    def column_names(self, counters, phases=()):
+        names = list(counters)
+        if self.timing:
+            names += [f"{name}_NS" for name in phases] + ['P50_NS', 'P99_NS']
+        return names
+
+    def export(self, counters, phases=()):
+        '''
+        Returns the stats csv columns for the given counters (and the
+        phase times and latency percentiles when timing)
+        '''
+        row = [self.counters[name] for name in counters]
+        if self.timing:
+            row += [self.phase_ns[name] for name in phases]
+            row += [self.latency_percentile(50), self.latency_percentile(99)]
+        return row
+
+class NullInstrumentation:
+    '''
+    Disabled instrumentation. The hot paths check `enabled` and `timing`
+    before recording anything, so nothing is recorded or timed
+    '''
+    enabled = False
+    timing = False
+
+    def count(self, name, n=1):
+        pass
+
+    def phase_time(self, name, ns):
+        pass
+
+    def record_latency(self, ns):
+        pass
+
+    def column_names(self, counters, phases=()):
+        return []
+
+    def export(self, counters, phases=()):
+        return []
+
+NULL_INSTRUMENTATION = NullInstrumentation()
@@ -0,0 +1,201 @@
+'''
+Searches the lane layout of CustomPolicy for a container size and a rect
+size distribution, and writes the best one as a config the policy loads:
+
+    python layout_search.py --width 128 --height 256 -o out/layout_128x256.json
+    python app.py --height 256 --layout out/layout_128x256.json
+
+The candidates are the layouts of build_lane_layout with 0..--max-pairs
+groups of each lane pair. Each is scored by the mean utilization over a
+set of seeds, with successive halving: every round keeps the better half
+of the candidates and doubles their seeds. A seed is packed by app.run,
+with the same two strikes stop as every other run, and a layout with an
+invalid packing for any seed is rejected. The (layout, seed) evaluations
+run in a process pool and are cached in a json file, so a later search
+over the same workload only evaluates what is new.
+'''
+import argparse
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from app import derive_seeds, generate_random_rectangles, run
+from defines import *
+from policies import CustomPolicy, build_lane_layout
+
+CACHE_FILE = 'out/layout_cache.json'
+
+# part of the evaluation keys, changed whenever evaluate scores differently
+EVALUATION_VERSION = 2
+
+def candidate_layouts(height, min_lane, max_lane, max_pairs=2):
+    '''
+    Every distinct strip grouping with 0 to max_pairs groups of each pair
+    of lanes that fits the height, the rest filled with single lanes
+    '''
+    num_pairs = max_lane//2 - min_lane + 1
+    layouts = []
+    seen = set()
+    for pair_counts in itertools.product(range(max_pairs + 1), repeat=num_pairs):
+        if sum(pair_counts) * max_lane > height:
+            continue
+        strip_grouping = build_lane_layout(height, min_lane, max_lane, pair_counts)
+        key = json.dumps(strip_grouping)
+        if key not in seen:
+            seen.add(key)
+            layouts.append(strip_grouping)
+    return layouts
+
+def evaluation_key(strip_grouping, min_lane, seed, workload):
+    text = json.dumps([EVALUATION_VERSION, strip_grouping, min_lane, seed, workload])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def evaluate(task):
+    '''
+    Utilization of one layout for one seed as app.run measures it, or
+    None if the layout it packed is invalid
+    '''
+    strip_grouping, min_lane, seed, workload = task
+    width, height, num, min_w, max_w, min_h, max_h = workload
+    random.seed(seed)
+    rectangles = generate_random_rectangles(num, min_w, max_w, min_h, max_h)
+    # without the per run prints, thousands of evaluations are made
+    with contextlib.redirect_stdout(io.StringIO()):
+        stat = run(False, seed, policy=CustomPolicy, width=width, height=height, rectangles=rectangles,
+                   policy_kwargs={'strip_grouping': strip_grouping, 'min_lane': min_lane})
+    invalid = stat[-1]
+    return None if invalid else stat[1]
+
+class EvaluationCache:
+    '''
+    Utilization of (layout, seed, workload) evaluations, kept in a json file
+    '''
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self.results = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.results = json.load(f)
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def put(self, key, utilization):
+        # None for an invalid packing
+        self.results[key] = utilization
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.results, f)
+        os.replace(tmp_path, self.path)
+
+def score_layouts(layouts, min_lane, seeds, workload, cache, pool):
+    '''
+    Mean utilization of every layout over the seeds, evaluating in the pool
+    only the (layout, seed) pairs missing from the cache. A layout with an
+    invalid packing scores -inf, so it is never kept or picked
+    '''
+    tasks, keys = [], []
+    for strip_grouping in layouts:
+        for seed in seeds:
+            key = evaluation_key(strip_grouping, min_lane, seed, workload)
+            if key not in cache:
+                tasks.append((strip_grouping, min_lane, seed, workload))
+                keys.append(key)
+
+    chunksize = max(1, len(tasks) // (4 * (os.cpu_count() or 1)))
+    for key, utilization in zip(keys, pool.map(evaluate, tasks, chunksize=chunksize)):
+        cache.put(key, utilization)
+    cache.save()
+
+    scores = []
+    for strip_grouping in layouts:
+        utils = [cache.get(evaluation_key(strip_grouping, min_lane, seed, workload)) for seed in seeds]
+        scores.append(-math.inf if None in utils else sum(utils) / len(utils))
+    return scores
+
+def search(workload, min_lane, max_lane, seeds=16, rounds=3, max_pairs=2, master_seed=0,
+           workers=None, cache_file=CACHE_FILE):
+    '''
+    Successive halving over the candidate layouts. Returns the config of
+    the best one, with its score and the default layout's over the seeds
+    of the last round
+    '''
+    width, height = workload[0], workload[1]
+    layouts = candidate_layouts(height, min_lane, max_lane, max_pairs)
+    all_seeds = derive_seeds(master_seed, seeds * 2**(rounds - 1))
+    cache = EvaluationCache(cache_file)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        num_seeds = seeds
+        for round_num in range(rounds):
+            scores = score_layouts(layouts, min_lane, all_seeds[:num_seeds], workload, cache, pool)
+            ranked = sorted(range(len(layouts)), key=lambda i: scores[i], reverse=True)
+            rejected = sum(score == -math.inf for score in scores)
+            print(f"round {round_num}: {len(layouts)} layouts x {num_seeds} seeds, {rejected} invalid, "
+                  f"best {scores[ranked[0]]:.2f}% {layouts[ranked[0]]}")
+            if round_num == rounds - 1 or len(layouts) == 1:
+                break
+            layouts = [layouts[i] for i in ranked[:max(1, len(layouts) // 2)]]
+            num_seeds *= 2
+
+        default = build_lane_layout(height, min_lane, max_lane)
+        default_score, = score_layouts([default], min_lane, all_seeds[:num_seeds], workload, cache, pool)
+
+    best = ranked[0]
+    return {'width'              : width,
+            'height'             : height,
+            'min_lane'           : min_lane,
+            'strip_grouping'     : layouts[best],
+            'utilization'        : scores[best],
+            'default_utilization': default_score,
+            'seeds'              : num_seeds,
+            'workload'           : dict(zip(['width', 'height', 'num', 'min_w', 'max_w', 'min_h', 'max_h'], workload))}
+
+def save_layout(layout, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(layout, f, indent=1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=container_width)
+    parser.add_argument('--height', type=int, default=container_height)
+    parser.add_argument('--num-rectangles', type=int, default=num_rectangles)
+    parser.add_argument('--min-width', type=int, default=min_rect_width)
+    parser.add_argument('--max-width', type=int, default=max_rect_width)
+    parser.add_argument('--min-height', type=int, default=min_rect_height)
+    parser.add_argument('--max-height', type=int, default=max_rect_height)
+    parser.add_argument('--seeds', type=int, default=16, help="seeds per layout in the first round")
+    parser.add_argument('--rounds', type=int, default=3, help="successive halving rounds")
+    parser.add_argument('--max-pairs', type=int, default=2, help="most groups of each lane pair")
+    parser.add_argument('--master-seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, help="worker processes, all cores by default")
+    parser.add_argument('--cache', default=CACHE_FILE, help="evaluation cache file, '' to disable")
+    parser.add_argument('-o', '--output', help="layout config file, out/layout_<w>x<h>.json by default")
+    args = parser.parse_args()
+
+    workload = [args.width, args.height, args.num_rectangles,
+                args.min_width, args.max_width, args.min_height, args.max_height]
+    # lanes are as tall as the tallest rect, the smallest as the shortest one
+    layout = search(workload, args.min_height, args.max_height, args.seeds, args.rounds, args.max_pairs,
+                    args.master_seed, args.workers, args.cache)
+
+    print(f"best layout {layout['strip_grouping']}: {layout['utilization']:.2f}% "
+          f"(default layout {layout['default_utilization']:.2f}%)")
+    path = args.output or f"out/layout_{args.width}x{args.height}.json"
+    save_layout(layout, path)
+    print(f"written to {path}")
@@ -0,0 +1,108 @@
+'''
+Packing into as many bins as needed, each bin a Container of any policy.
+'''
+import numpy as np
+from base import MaxSegmentTree, Rectangle, rectangle_sizes
+
+class MultiBinPacker:
+    '''
+    Opens a new bin when none of the open ones can take an item.
+
+    The bins are indexed by a segment tree over their capacity: the free
+    area, lowered to area-1 whenever the bin rejects an item of that area.
+    The first bin which may take an item is found in O(log bins), and a
+    full bin stops being tried for anything as large as what it rejected.
+    At most max_tries bins are tried per item before a new one is opened.
+    An item a new, empty bin rejects is not placed, and the new bin is
+    dropped; later items of that size are rejected right away
+    '''
+    def __init__(self, policy, width, height, max_tries=4, **policy_kwargs):
+        self.policy = policy
+        self.width = width
+        self.height = height
+        self.max_tries = max_tries
+        self.policy_kwargs = policy_kwargs
+
+        self.bins = []
+        self.capacity = MaxSegmentTree()
+        # (width, height) of the items an empty bin rejected
+        self.unplaceable = set()
+
+    def try_bin(self, bin_num, rectangle):
+        area = rectangle.width * rectangle.height
+        container = self.bins[bin_num]
+        if container.place_rectangle(rectangle):
+            self.capacity.update(bin_num, self.capacity[bin_num] - area)
+            placed = container.rectangles
+            return bin_num, int(placed.x[-1]), int(placed.y[-1])
+
+        self.capacity.update(bin_num, min(self.capacity[bin_num], area - 1))
+        return None
+
+    def place_rectangle(self, rectangle):
+        '''
+        Returns (bin index, x, y), or None if the rect has no area or does
+        not fit even in an empty bin
+        '''
+        if rectangle.width <= 0 or rectangle.height <= 0 or rectangle.width > self.width or rectangle.height > self.height or \
+                (rectangle.width, rectangle.height) in self.unplaceable:
+            return None
+
+        area = rectangle.width * rectangle.height
+        for _ in range(self.max_tries):
+            bin_num = self.capacity.leftmost_above(area - 1)
+            if bin_num is None:
+                break
+            placement = self.try_bin(bin_num, rectangle)
+            if placement is not None:
+                return placement
+
+        container = self.policy(self.width, self.height, **self.policy_kwargs)
+        if not container.place_rectangle(rectangle):
+            if self.policy.deterministic:
+                self.unplaceable.add((rectangle.width, rectangle.height))
+            return None
+        self.bins.append(container)
+        self.capacity.append(self.width * self.height - area)
+        placed = container.rectangles
+        return len(self.bins) - 1, int(placed.x[-1]), int(placed.y[-1])
+
+    def pack_all(self, rectangles):
+        '''
+        Places a whole batch (Rectangles or an (n, 2) array of widths and
+        heights, sorted first for presort policies). Returns the bin, x and
+        y arrays of the placements in input order, -1 where a rectangle
+        could not be placed
+        '''
+        sizes = rectangle_sizes(rectangles)
+        num = len(sizes)
+        bins = np.full(num, -1, dtype=np.int64)
+        xs = np.full(num, -1, dtype=np.int64)
+        ys = np.full(num, -1, dtype=np.int64)
+
+        if self.policy.presort:
+            order = np.argsort(-sizes[:, 1], kind='stable').tolist()
+        else:
+            order = range(num)
+        widths, heights = sizes[:, 0].tolist(), sizes[:, 1].tolist()
+
+        probe = Rectangle(0, 0, 0, 0)
+        for i in order:
+            probe.width, probe.height = widths[i], heights[i]
+            placement = self.place_rectangle(probe)
+            if placement is not None:
+                bins[i], xs[i], ys[i] = placement
+        return bins, xs, ys
+
+    def verify(self):
+        '''
+        LayoutReport of every bin
+        '''
+        return [container.verify() for container in self.bins]
+
+    def utilization(self):
+        '''
+        Utilization percentage of every bin
+        '''
+        total_area = self.width * self.height
+        return [container.rectangles.used_area() / total_area * 100 for container in self.bins]
@@ -1,13 +1,38 @@
+import bisect
+import heapq
+import itertools
+import json
 import random
 from base import *
-from app import Container
+from container import Container
 import numpy as np
 
 class RandomizedPolicy(Container):
+    '''
+    Places each rectangle at a random position that does not intersect any
+    of the already placed rectangles, giving up after MAX_ITER tries.
+    With batched=True the candidate positions are drawn in batches growing
+    from MIN_BATCH_SIZE to BATCH_SIZE. A batch is tested against a grid of
+    the occupied cells kept up to date as rectangles are placed, or against
+    the placed rectangles when they are fewer than the cells a candidate
+    covers, so large rects neither copy large windows of the grid nor need
+    the grid at all.
+    '''
     name = "random"
-    def __init__(self, *args, **kwargs):
-        self.policy = self.randomized_policy
+    policy_in_bounds = True
+    deterministic = False
+    supports_removal = True
+    stat_counters = ['RANDOM.CANDIDATES']
+    def __init__(self, *args, batched=False, **kwargs):
+        self.policy = self.batched_randomized_policy if batched else self.randomized_policy
         self.MAX_ITER=5000
+        self.MIN_BATCH_SIZE=8
+        self.BATCH_SIZE=1024
+
+        self.rng = None
+        self.grid = None
+        self.windows = {}
+        self.grid_size = self.grid_version = 0
         super(RandomizedPolicy, self).__init__(*args, **kwargs)
 
     def randomized_policy(self, rectangle):
@@ -22,48 +47,168 @@ class RandomizedPolicy(Container):
             x = random.randint(0, max_x)
             y = random.randint(0, max_y)
 
-            for rect in self.rectangles:
-                if rect.intersects(Rectangle(x, y, rectangle.width, rectangle.height)):
-                    # if intersects, then break the loop and search again with new position
-                    break
-            else:
-                # this block is only executed if the main for loop encountered no breaks 
-                # which means that the new position of the rectangle is good to go
+            if not self.rectangles.intersects(x, y, rectangle.width, rectangle.height).any():
+                # the new position of the rectangle is good to go
                 break
-            if (i%1000 ==0):
-                print(f"#{len(self.rectangles)} LOOKING for {i}th time")
             i=i+1
             if (i>=self.MAX_ITER):
+                if self.instrumentation.enabled:
+                    self.instrumentation.count('RANDOM.CANDIDATES', i-1)
                 return None, None
             
+        if self.instrumentation.enabled:
+            self.instrumentation.count('RANDOM.CANDIDATES', i)
         return x, y
 
+    def occupancy_grid(self):
+        '''
+        Boolean grid of the cells covered by placed rects, grid[y, x].
+        Rects appended since the last call are drawn into it; after a
+        removal or a rollback it is redrawn from all the placements
+        '''
+        store = self.rectangles
+        added = len(store) - self.grid_size
+        if self.grid is None or store.version - self.grid_version != added or added < 0:
+            self.grid = np.zeros((self.height, self.width), dtype=bool)
+            self.windows = {}
+            first = 0
+        else:
+            first = self.grid_size
+        for x, y, width, height in store.data[:, first:len(store)].T.tolist():
+            self.grid[y:y + height, x:x + width] = True
+        self.grid_size, self.grid_version = len(store), store.version
+        return self.grid
+
+    def batched_randomized_policy(self, rectangle):
+        max_x = self.width - rectangle.width
+        max_y = self.height - rectangle.height
+
+        if max_x < 0 or max_y < 0:
+            return None, None  # Rectangle is too large to fit
+
+        if self.rng is None:
+            # seeded from the global random module on first use, so set_seed
+            # keeps the run reproducible and the workload is not shifted
+            self.rng = np.random.default_rng(random.getrandbits(64))
+
+        # a candidate is tested against the w*h cells it covers, or with 4
+        # comparisons per placed rect, whichever is cheaper
+        store = self.rectangles
+        if rectangle.width * rectangle.height <= 4 * len(store):
+            grid = self.occupancy_grid()
+            # windows[y, x] is the part of the grid the rect covers at
+            # (x, y), a view made once per rect size
+            shape = (rectangle.height, rectangle.width)
+            windows = self.windows.get(shape)
+            if windows is None:
+                windows = self.windows[shape] = np.lib.stride_tricks.sliding_window_view(grid, shape)
+        else:
+            windows = None
+            placed_x, placed_y = store.x, store.y
+            placed_right, placed_top = placed_x + store.width, placed_y + store.height
+
+        # same budget as randomized_policy: at most MAX_ITER-1 candidates,
+        # drawn in batches growing from MIN_BATCH_SIZE to BATCH_SIZE, so an
+        # easy placement only draws a few
+        drawn = 0
+        batch = self.MIN_BATCH_SIZE
+        while drawn < self.MAX_ITER - 1:
+            batch = min(batch, self.MAX_ITER - 1 - drawn)
+            # scaled uniform floats, much cheaper to draw than integers
+            xs = (self.rng.random(batch) * (max_x + 1)).astype(np.intp)
+            ys = (self.rng.random(batch) * (max_y + 1)).astype(np.intp)
+
+            if windows is not None:
+                free = ~windows[ys, xs].reshape(batch, -1).any(axis=1)
+            else:
+                free = ((xs[:, None] + rectangle.width <= placed_x) | (ys[:, None] + rectangle.height <= placed_y) |
+                        (xs[:, None] >= placed_right) | (ys[:, None] >= placed_top)).all(axis=1)
+            if free.any():
+                # first free candidate in draw order
+                i = int(free.argmax())
+                if self.instrumentation.enabled:
+                    self.instrumentation.count('RANDOM.CANDIDATES', drawn + i + 1)
+                return int(xs[i]), int(ys[i])
+            drawn += batch
+            batch = min(2 * batch, self.BATCH_SIZE)
+
+        if self.instrumentation.enabled:
+            self.instrumentation.count('RANDOM.CANDIDATES', drawn)
+        return None, None
+
 class FFDHPolicy(Container):
     '''
     FFDH packs the next item R (in non-increasing height) on the first level
     where R fits. If no level can accommodate R, a new level is created.
     Time complexity of FFDH: O(n·log n).
+    The strips are bucketed by height, the heights are kept sorted and each
+    bucket has a segment tree over the residual width of its strips, so a
+    strip is selected without scanning all of them.
     '''
     name = "FFDH"
+    presort = True
+    policy_in_bounds = True
+    stat_counters = ['LEVEL.STRIPS_OPENED']
     def __init__(self, *args, **kwargs):
         self.policy = self.ffdh_packing
         self.strips = []
+        self.bucket_heights = []     # sorted distinct strip heights
+        self.buckets        = {}     # strip height -> (residual width tree, strip nums)
+        self.bucket_pos     = []     # strip num -> position in its bucket
 
         self.NUM_STRIPS = 0
         self.LATEST_STRIP_OFF = 0
     
         super(FFDHPolicy, self).__init__(*args, **kwargs)
 
+    def index_strip(self, strip_num):
+        '''
+        Updates the strip index after the strip is created or filled further
+        '''
+        strip_height, strip_height_off, occupied_strip_width = self.strips[strip_num]
+        if strip_num == len(self.bucket_pos):
+            if strip_height not in self.buckets:
+                bisect.insort(self.bucket_heights, strip_height)
+                self.buckets[strip_height] = (MaxSegmentTree(), [])
+            tree, strip_nums = self.buckets[strip_height]
+            self.bucket_pos.append(len(strip_nums))
+            strip_nums.append(strip_num)
+            tree.append(self.width - occupied_strip_width)
+        else:
+            tree, strip_nums = self.buckets[strip_height]
+            tree.update(self.bucket_pos[strip_num], self.width - occupied_strip_width)
+
+    def undo_fill(self, strip_num, occupied_strip_width):
+        self.strips[strip_num][2] = occupied_strip_width
+        self.index_strip(strip_num)
+
+    def undo_open_strip(self):
+        strip_height = self.strips.pop()[0]
+        self.NUM_STRIPS       = self.NUM_STRIPS - 1
+        self.LATEST_STRIP_OFF = self.LATEST_STRIP_OFF - strip_height
+
+        tree, strip_nums = self.buckets[strip_height]
+        tree.pop()
+        strip_nums.pop()
+        self.bucket_pos.pop()
+        if not strip_nums:
+            del self.buckets[strip_height]
+            self.bucket_heights.remove(strip_height)
+
     def select_strip(self,rectangle):
-        for strip_num, strip in enumerate(self.strips):
-            strip_height, strip_height_off, occupied_strip_width = strip[0], strip[1], strip[2]
-
-            # check if new rect is smaller than the first rectangle in the strip and
-            # check if the strip has space
-            if rectangle.height < strip_height and \
-                rectangle.width < self.width - occupied_strip_width:
-                return strip_num
-        return None
+        # first strip which is at least as tall as the new rect and has
+        # at least its width left: the first such strip of every bucket
+        # that high is a candidate
+        chosen_strip_num = None
+        first = bisect.bisect_left(self.bucket_heights, rectangle.height)
+        for strip_height in self.bucket_heights[first:]:
+            tree, strip_nums = self.buckets[strip_height]
+            if chosen_strip_num is not None and strip_nums[0] > chosen_strip_num:
+                continue
+            pos = tree.leftmost_above(rectangle.width - 1)
+            if pos is not None and (chosen_strip_num is None or strip_nums[pos] < chosen_strip_num):
+                chosen_strip_num = strip_nums[pos]
+        return chosen_strip_num
 
     def ffdh_packing(self, rectangle):
         max_x = self.width - rectangle.width
@@ -78,15 +223,23 @@ class FFDHPolicy(Container):
             strip = self.strips[strip_num]
             strip_height_off, occupied_strip_width = strip[1], strip[2]
             strip[2] = occupied_strip_width + rectangle.width
+            self.index_strip(strip_num)
+            if self.undo_log is not None:
+                self.log_undo(self.undo_fill, strip_num, occupied_strip_width)
             return occupied_strip_width, strip_height_off
 
         if self.LATEST_STRIP_OFF + rectangle.height > self.height:
             return None, None
         
         #make a new strip
+        if self.instrumentation.enabled:
+            self.instrumentation.count('LEVEL.STRIPS_OPENED')
         self.strips.append([rectangle.height, self.LATEST_STRIP_OFF, rectangle.width])
+        self.index_strip(self.NUM_STRIPS)
         self.NUM_STRIPS       = self.NUM_STRIPS + 1
         self.LATEST_STRIP_OFF = self.LATEST_STRIP_OFF + rectangle.height
+        if self.undo_log is not None:
+            self.log_undo(self.undo_open_strip)
 
         #add the new rectangle at the beginning of the strip
         return 0, self.LATEST_STRIP_OFF - rectangle.height
@@ -101,79 +254,487 @@ class BFDHPolicy(FFDHPolicy):
     def __init__(self, *args, **kwargs):
         self.policy = self.ffdh_packing
         self.strips = []
+        self.bucket_heights = []
+        self.buckets        = {}
+        self.bucket_pos     = []
 
         self.NUM_STRIPS = 0
         self.LATEST_STRIP_OFF = 0
         super(FFDHPolicy, self).__init__(*args, **kwargs)
 
     def select_strip(self,rectangle):
-        minimum_residual_height = self.height
-        chosen_strip_num = None
-        for strip_num, strip in enumerate(self.strips):
-            strip_height, strip_height_off, occupied_strip_width = strip[0], strip[1], strip[2]
-
-            if strip_height > rectangle.height:
-                if strip_height - rectangle.height < minimum_residual_height and \
-                        rectangle.width < self.width - occupied_strip_width:
-                    minimum_residual_height = strip_height - rectangle.height
-                    chosen_strip_num = strip_num
-        return chosen_strip_num
+        # the lowest strip height fitting the new rect leaves the minimum
+        # residual height; within a bucket take the first strip with space
+        first = bisect.bisect_left(self.bucket_heights, rectangle.height)
+        for strip_height in self.bucket_heights[first:]:
+            tree, strip_nums = self.buckets[strip_height]
+            pos = tree.leftmost_above(rectangle.width - 1)
+            if pos is not None:
+                return strip_nums[pos]
+        return None
 
 class BottomLeftPolicy(Container):
+    name = "bottom_left"
     def __init__(self, *args, **kwargs):
         self.policy = self.bottom_left_policy
         super(BottomLeftPolicy, self).__init__(*args, **kwargs)
     
     def bottom_left_policy(self, rectangle):
-        x, y = 0, 0
-        for rect in self.rectangles:
-            if rect.x + rect.width > x:
-                x = rect.x + rect.width
-            if rect.y + rect.height > y:
-                y = rect.y + rect.height
+        return self.rectangles.bounding_box()
+
+class SkylinePolicy(Container):
+    '''
+    Bottom-left skyline packing: the next rect goes where it sits lowest,
+    then leftmost. The skyline heights of the columns are kept in a
+    MaxSegmentTree, and every segment (run of columns of one height) in a
+    dict by its start, with its basin: the widest run of columns around it
+    that are not higher. A rect of width w sits lowest at the start of the
+    basin of the lowest segment whose basin is at least w wide, so the
+    segments are also indexed by basin width and the position is a range
+    query over the widths >= w. Placing a rect only changes the basins of
+    the segments next to it that it now blocks, so the cost of a placement
+    does not grow with the number of segments.
+    '''
+    name = "skyline"
+    policy_in_bounds = True
+    stat_counters = ['SKYLINE.SEGMENTS']
+    def __init__(self, *args, **kwargs):
+        self.policy = self.skyline_policy
+        super(SkylinePolicy, self).__init__(*args, **kwargs)
+        self.skyline  = MaxSegmentTree.filled(self.width, 0)
+        self.segments = {}  # segment start -> (end, height, basin start, basin end)
+        self.starts   = {}  # segment end -> segment start
+        # basin width -> heap of (height, basin start, segment start), with
+        # stale entries dropped when they come on top
+        self.by_basin = [[] for _ in range(self.width + 1)]
+        # basin width -> -(height * (width+1) + basin start) of the top of
+        # its heap, so the max over the widths >= w is the lowest position
+        self.lowest = MaxSegmentTree.filled(self.width + 1, MaxSegmentTree.EMPTY)
+        self.stale = set()  # basin widths whose heap changed since the last refresh
+        self.store_segment(0, (self.width, 0, 0, self.width))
+
+    def store_segment(self, start, segment):
+        '''
+        Sets (or deletes, with None) the segment starting at start
+        '''
+        old = self.segments.pop(start, None)
+        if old is not None:
+            del self.starts[old[0]]
+        if segment is not None:
+            end, height, basin_start, basin_end = segment
+            self.segments[start] = segment
+            self.starts[end] = start
+            heapq.heappush(self.by_basin[basin_end - basin_start], (height, basin_start, start))
+            self.stale.add(basin_end - basin_start)
+        if old is not None:
+            self.stale.add(old[3] - old[2])
+
+    def refresh_basins(self):
+        for basin_width in self.stale:
+            heap = self.by_basin[basin_width]
+            while heap:
+                height, basin_start, start = heap[0]
+                segment = self.segments.get(start)
+                if segment is not None and segment[1:] == (height, basin_start, basin_start + basin_width):
+                    break
+                heapq.heappop(heap)
+            key = -(heap[0][0] * (self.width + 1) + heap[0][1]) if heap else MaxSegmentTree.EMPTY
+            if self.lowest[basin_width] != key:
+                self.lowest.update(basin_width, key)
+        self.stale.clear()
+
+    def set_segment(self, start, segment):
+        if self.undo_log is not None:
+            self.log_undo(self.store_segment, start, self.segments.get(start))
+        self.store_segment(start, segment)
+
+    def raise_skyline(self, x, top, width):
+        '''
+        Raises the skyline under a rect placed at x to top, above all the
+        columns it covers
+        '''
+        skyline, segments, end_x = self.skyline, self.segments, x + width
+        covered = [x]
+        while segments[covered[-1]][0] < end_x:
+            covered.append(segments[covered[-1]][0])
+        # the last covered segment may stick out on the right
+        last_end, last_height, _, last_basin_end = segments[covered[-1]]
+        if self.undo_log is not None:
+            self.log_undo(self.undo_skyline, [(start, min(segments[start][0], end_x), segments[start][1])
+                                              for start in covered])
+        for start in covered:
+            self.set_segment(start, None)
+        skyline.assign(x, end_x, top)
+        if last_end > end_x:
+            self.set_segment(end_x, (last_end, last_height, end_x, last_basin_end))
+
+        # merged with the neighbours of the same height
+        start, end = x, end_x
+        if start in self.starts and segments[self.starts[start]][1] == top:
+            start = self.starts[start]
+            self.set_segment(start, None)
+        if end in segments and segments[end][1] == top:
+            end = segments[end][0]
+            self.set_segment(end_x, None)
+        self.set_segment(start, (end, top, skyline.rightmost_at_least(start, top + 1) + 1,
+                                 skyline.leftmost_at_least(end, top + 1)))
+
+        # the lower segments on either side whose basins reached over the
+        # rect now end at it: going away from it, each one at least as
+        # high as the ones before
+        column, height = start, float('-inf')
+        while True:
+            column = skyline.rightmost_at_least(column, height)
+            if column < 0:
+                break
+            column = self.starts[column + 1]
+            seg_end, height, basin_start, basin_end = segments[column]
+            if height >= top:
+                break
+            if basin_end != start:
+                self.set_segment(column, (seg_end, height, basin_start, start))
+        column, height = end, float('-inf')
+        while True:
+            column = skyline.leftmost_at_least(column, height)
+            if column >= self.width:
+                break
+            seg_end, height, basin_start, basin_end = segments[column]
+            if height >= top:
+                break
+            if basin_start != end:
+                self.set_segment(column, (seg_end, height, end, basin_end))
+            column = seg_end
+
+    def undo_skyline(self, runs):
+        for start, end, y in runs:
+            self.skyline.assign(start, end, y)
+
+    def skyline_policy(self, rectangle):
+        if rectangle.width <= 0 or rectangle.height <= 0:
+            # would leave a segment of no width in the skyline
+            return None, None
+        max_x = self.width - rectangle.width
+        max_y = self.height - rectangle.height
+        if max_x < 0 or max_y < 0:
+            return None, None  # Rectangle is too large to fit
+
+        if self.instrumentation.enabled:
+            self.instrumentation.count('SKYLINE.SEGMENTS', len(self.segments))
+        self.refresh_basins()
+        key = self.lowest.range_max(rectangle.width, self.width + 1)
+        if key == MaxSegmentTree.EMPTY:
+            return None, None
+        y, x = divmod(-key, self.width + 1)
+        if y > max_y:
+            return None, None
+
+        self.raise_skyline(x, y + rectangle.height, rectangle.width)
         return x, y
 
-class CustomPolicy(Container):
+def contained(inner, outer):
     '''
-    Custom policy has specific lanes for each height
+    (len(inner), len(outer)) matrix telling which rects of the (4, n)
+    x, y, width, height array inner lie inside which rects of outer
     '''
-    name = "custom"
+    ix, iy, iw, ih = inner[:, :, None]
+    ox, oy, ow, oh = outer[:, None, :]
+    return (ox <= ix) & (oy <= iy) & (ox + ow >= ix + iw) & (oy + oh >= iy + ih)
+
+def split_free_rects(free, x, y, width, height):
+    '''
+    Splits the free rects ((4, n) array) overlapped by the rect at (x, y)
+    into their parts left of, right of, below and above it. Returns the
+    indices of the overlapped ones and the parts
+    '''
+    fx, fy, fw, fh = free
+    hit = np.flatnonzero(~((x + width <= fx) | (y + height <= fy) | (x >= fx + fw) | (y >= fy + fh)))
+    fx, fy, fw, fh = free[:, hit]
+    right, top = x + width, y + height
+    parts = np.concatenate([
+        np.stack([fx, fy, x - fx, fh])[:, fx < x],
+        np.stack([np.full_like(fx, right), fy, fx + fw - right, fh])[:, fx + fw > right],
+        np.stack([fx, fy, fw, y - fy])[:, fy < y],
+        np.stack([fx, np.full_like(fy, top), fw, fy + fh - top])[:, fy + fh > top]], axis=1)
+    return hit, parts
+
+def maximal_rects(rects):
+    '''
+    The rects of a (4, n) array not contained in another one (the first
+    of equal rects is kept)
+    '''
+    inside = contained(rects, rects)
+    num = rects.shape[1]
+    # a rect is never dropped for itself, nor for a later equal one
+    equal = inside & inside.T
+    inside &= ~(equal & (np.arange(num)[:, None] <= np.arange(num)[None, :]))
+    return rects[:, ~inside.any(axis=1)]
+
+class MaxRectsPolicy(Container):
+    '''
+    MaxRects packing, with removal. The free space is kept as the list of
+    maximal free rectangles: free rects not contained in another free
+    rect, overlapping each other. A new rect goes to the bottom left corner
+    of the free rect it fits in leaving the shortest leftover side (best
+    short side fit), then the lowest, then the leftmost one.
+
+    The free rects are kept as a (4, n) int array, so a fit query is one
+    vectorized pass over them. Placing a rect splits the free rects it
+    overlaps into the parts around it, keeping the maximal ones. Removing a
+    rect only recomputes the maximal free rects that overlap it (any new
+    maximal rect overlaps it): the container is split by the placed rects,
+    nearest first, keeping only the parts that still overlap the freed rect.
+    The free rects contained in the new ones are dropped
+    '''
+    name = "maxrects"
+    policy_in_bounds = True
+    supports_removal = True
+    stat_counters = ['MAXRECTS.FREE_RECTS']
     def __init__(self, *args, **kwargs):
-        self.policy = self.fixed_lane_packing
+        self.policy = self.maxrects_policy
+        super(MaxRectsPolicy, self).__init__(*args, **kwargs)
+        self.free = np.array([[0], [0], [self.width], [self.height]], dtype=np.int64)
+
+    def replace_free(self, removed, added):
+        '''
+        Removes the free rects at the indices removed and appends the added ones
+        '''
+        if self.undo_log is not None:
+            self.log_undo(self.undo_free, removed, self.free[:, removed], added.shape[1])
+        keep = np.ones(self.free.shape[1], dtype=bool)
+        keep[removed] = False
+        self.free = np.concatenate([self.free[:, keep], added], axis=1)
+
+    def undo_free(self, removed, removed_rects, num_added):
+        free = self.free[:, :self.free.shape[1] - num_added]
+        self.free = np.insert(free, removed - np.arange(len(removed)), removed_rects, axis=1)
+
+    def maxrects_policy(self, rectangle):
+        width, height = rectangle.width, rectangle.height
+        fx, fy, fw, fh = self.free
+        if self.instrumentation.enabled:
+            self.instrumentation.count('MAXRECTS.FREE_RECTS', len(fx))
+
+        fits = np.flatnonzero((fw >= width) & (fh >= height))
+        if len(fits) == 0:
+            return None, None
+        leftover_w, leftover_h = fw[fits] - width, fh[fits] - height
+        best = fits[np.lexsort((fx[fits], fy[fits], np.maximum(leftover_w, leftover_h),
+                                np.minimum(leftover_w, leftover_h)))[0]]
+        x, y = int(fx[best]), int(fy[best])
+
+        hit, parts = split_free_rects(self.free, x, y, width, height)
+        keep = np.ones(self.free.shape[1], dtype=bool)
+        keep[hit] = False
+        # the parts lie inside the split rects, so they can not contain any
+        # other maximal rect, but may lie inside one
+        parts = maximal_rects(parts)
+        parts = parts[:, ~contained(parts, self.free[:, keep]).any(axis=1)]
+        self.replace_free(hit, parts)
+        return x, y
+
+    def free_space(self, x, y, width, height):
+        placed = self.rectangles
+        obstacles = np.stack([placed.x, placed.y, placed.width, placed.height]).astype(np.int64)
+        ox, oy, ow, oh = obstacles
+        # nearest placed rects to the freed one first, they cut the most
+        gap = (np.maximum(0, np.maximum(ox - (x + width), x - (ox + ow))) +
+               np.maximum(0, np.maximum(oy - (y + height), y - (oy + oh))))
+        obstacles = obstacles[:, np.argsort(gap, kind='stable')]
+
+        candidates = np.array([[0], [0], [self.width], [self.height]], dtype=np.int64)
+        while obstacles.shape[1]:
+            # next placed rect overlapping a candidate; the candidates only
+            # shrink, so the ones skipped never overlap them again
+            cx, cy, cw, ch = candidates[:, :, None]
+            ox, oy, ow, oh = obstacles[:, None, :]
+            overlapping = (~((cx + cw <= ox) | (cy + ch <= oy) | (cx >= ox + ow) | (cy >= oy + oh))).any(axis=0)
+            if not overlapping.any():
+                break
+            i = int(overlapping.argmax())
+            hit, parts = split_free_rects(candidates, *obstacles[:, i].tolist())
+            obstacles = obstacles[:, i+1:]
 
-        self.strip_grouping   = [[12,4], [11,5], [10,6], [9,7], [8,8],  [16],[16],[16]]
-        self.LARGEST_STRIP_GRP_INDEX = 5 # 16 blocks
-        self.NUM_STRIP_GROUPS = 8
+            px, py, pw, ph = parts
+            parts = parts[:, ~((x + width <= px) | (y + height <= py) | (x >= px + pw) | (y >= py + ph))]
+            keep = np.ones(candidates.shape[1], dtype=bool)
+            keep[hit] = False
+            candidates = maximal_rects(np.concatenate([candidates[:, keep], parts], axis=1))
 
-        self.strip_heights           = [ 12, 4,  11,  5,  10,  6,  9, 7,  8,  8, 16, 16,16]
-        self.strip_alternate_heights = [[11],[],[10],[4],[9],[5],[8],[6],[7],[7], [],[],[]]
+        # no free rect overlaps the freed rect, but some lie inside the new ones
+        removed = np.flatnonzero(contained(self.free, candidates).any(axis=1))
+        self.replace_free(removed, candidates)
 
-        self.strip_height_off = [0]+list(np.cumsum(self.strip_heights)[:-1])
+def build_lane_layout(height, min_lane=4, max_lane=16, pair_counts=None):
+    '''
+    Generates the strip grouping of CustomPolicy for a container height:
+    pairs of lanes adding up to max_lane ([12,4], [11,5], ..., [8,8]),
+    then single max_lane lanes and a last lane for the leftover height.
+    pair_counts gives how many groups of each pair there are, in that
+    order (one of each by default, as long as they fit).
+    For a height of 128 this is the original hand written layout
+    '''
+    if height < min_lane:
+        raise ValueError(f"Container height {height} is below the smallest lane height {min_lane}")
+    pairs = [[max_lane - small_lane, small_lane] for small_lane in range(min_lane, max_lane//2 + 1)]
+    if pair_counts is None:
+        pair_counts = [1] * len(pairs)
+
+    strip_grouping = []
+    remaining = height
+    for pair, count in zip(pairs, pair_counts):
+        for _ in range(count):
+            if remaining < max_lane:
+                break
+            strip_grouping.append(list(pair))
+            remaining -= max_lane
+    while remaining >= max_lane:
+        strip_grouping.append([max_lane])
+        remaining -= max_lane
+    if remaining >= min_lane:
+        strip_grouping.append([remaining])
+    return strip_grouping
+
+def load_layout(path):
+    '''
+    Reads a lane layout config, as written by layout_search.py
+    '''
+    with open(path) as f:
+        return json.load(f)
+
+class CustomPolicy(Container):
+    '''
+    Custom policy has specific lanes for each height.
+    The lane layout is compiled at construction into per-height tables of
+    native and alternate strips, and the free width of every strip group is
+    kept in a segment tree, so no placement scans the whole layout
+    '''
+    name = "custom"
+    stat_counters = ['EQUIFILL.ADD_AND_COMP', 'ALTERNATE.ADD_AND_COMP', 'ALTERNATE.MAX_OPERATION', 'ALTERNATE.INITIATED']
+    stat_phases   = ['EQUIFILL', 'ALTERNATE']
+    def __init__(self, *args, strip_grouping=None, min_lane=4, layout_file=None, **kwargs):
+        self.policy = self.fixed_lane_packing
+        super(CustomPolicy, self).__init__(*args, **kwargs)
+
+        if layout_file is not None:
+            layout = load_layout(layout_file)
+            strip_grouping, min_lane = layout['strip_grouping'], layout['min_lane']
+        if strip_grouping is None:
+            strip_grouping = build_lane_layout(self.height, min_lane)
+        if not strip_grouping or not all(strip_grouping):
+            raise ValueError(f"Lane layout {strip_grouping} has an empty strip group")
+        if sum(map(sum, strip_grouping)) > self.height:
+            raise ValueError(f"Lane layout {strip_grouping} is taller than the container height {self.height}")
+        self.strip_grouping   = strip_grouping
+        self.LARGEST_STRIP_GRP_INDEX = sum(len(group) == 2 for group in strip_grouping)
+        self.NUM_STRIP_GROUPS = len(strip_grouping)
+
+        # a lane of a pair also takes rects one smaller than itself
+        self.strip_heights           = [strip_h for group in strip_grouping for strip_h in group]
+        self.strip_alternate_heights = [[strip_h - 1] if len(group) == 2 and strip_h - 1 >= min_lane else []
+                                        for group in strip_grouping for strip_h in group]
+
+        self.strip_height_off = [0] + list(itertools.accumulate(self.strip_heights))[:-1]
+        self.layout_height    = sum(self.strip_heights)
         self.occupied_strip_width = [0 for _ in range(len(self.strip_heights))]
         self.invalid_range    = [None for _ in range(len(self.strip_heights))]
     
         self.NUM_STRIPS = len(self.strip_heights)
         self.LATEST_STRIP_OFF = 0
 
-        self.perf_counters = {'EQUIFILL'  :{'ADD_AND_COMP':0, 'INVALID_2_OPS':0, 'NON-INVALID_1_OP':0, 'NATIVE':0, 'ALTERNATE':0}, 
-                              'ALTERNATE' :{'ADD_AND_COMP':0, 'MAX_OPERATION':0, 'INITIATED':0}}
-        super(CustomPolicy, self).__init__(*args, **kwargs)
+        self.compile_layout()
+
+    def compile_layout(self):
+        '''
+        Builds the lookup tables, indexed by rect height:
+        native_strips   - strips of the lane the height belongs to
+        alternate_strips - strips that take the height as their alternate
+        and the group tables:
+        group_strips - strips of each group, strip_group - group of each strip
+        group_free   - for every distinct group height, a segment tree of the
+                       free width of the groups at least that high (EMPTY
+                       for the lower ones), so a rect only finds groups it
+                       fits in
+        '''
+        lane_heights = sorted(set(self.strip_heights))
+        self.MAX_LANE_HEIGHT = lane_heights[-1]
+
+        self.native_strips    = [()]
+        self.alternate_strips = [()]
+        for rec_height in range(1, self.MAX_LANE_HEIGHT + 1):
+            # heights without a lane of their own go to the next taller lane
+            lane = lane_heights[bisect.bisect_left(lane_heights, rec_height)]
+            self.native_strips.append(tuple(strip_num for strip_num, strip_h in enumerate(self.strip_heights)
+                                            if strip_h == lane))
+            self.alternate_strips.append(tuple(strip_num for strip_num, strip_h_l in enumerate(self.strip_alternate_heights)
+                                               for strip_h in strip_h_l if strip_h == lane))
+
+        self.group_strips = []
+        self.strip_group  = []
+        for strip_grp_num, values_l in enumerate(self.strip_grouping):
+            first = len(self.strip_group)
+            self.group_strips.append(tuple(range(first, first + len(values_l))))
+            self.strip_group.extend(strip_grp_num for _ in values_l)
+
+        self.group_heights = [sum(values_l) for values_l in self.strip_grouping]
+        self.fit_heights = sorted(set(self.group_heights))
+        self.group_free = {}
+        for fit_height in self.fit_heights:
+            self.group_free[fit_height] = MaxSegmentTree()
+            for group_height in self.group_heights:
+                self.group_free[fit_height].append(self.width if group_height >= fit_height else MaxSegmentTree.EMPTY)
+
+    def strip_end(self, strip_num):
+        '''
+        End of the filled part of a strip, including its invalid block
+        '''
+        if self.invalid_range[strip_num] is not None:
+            return self.invalid_range[strip_num][1]
+        return self.occupied_strip_width[strip_num]
+
+    def log_strip(self, strip_num):
+        '''
+        Records the fill of a strip before it changes, while checkpointing
+        '''
+        invalid_range = self.invalid_range[strip_num]
+        self.log_undo(self.undo_strip, strip_num, self.occupied_strip_width[strip_num],
+                      None if invalid_range is None else list(invalid_range))
+
+    def undo_strip(self, strip_num, occupied_strip_width, invalid_range):
+        self.occupied_strip_width[strip_num] = occupied_strip_width
+        self.invalid_range[strip_num] = invalid_range
+        self.refresh_group(strip_num)
+
+    def refresh_group(self, strip_num):
+        '''
+        Updates the free width of the group of a strip after it was filled
+        '''
+        strip_grp_num = self.strip_group[strip_num]
+        strips = self.group_strips[strip_grp_num]
+        if len(strips) == 2:
+            max_occupied_width = max(self.strip_end(strips[0]), self.strip_end(strips[1]))
+        else:
+            max_occupied_width = self.occupied_strip_width[strips[0]]
+        group_height = self.group_heights[strip_grp_num]
+        for fit_height in self.fit_heights:
+            if fit_height > group_height:
+                break
+            self.group_free[fit_height].update(strip_grp_num, self.width - max_occupied_width)
+
+    def candidate_strips(self, rectangle):
+        if rectangle.height > self.MAX_LANE_HEIGHT:
+            return (), ()
+        return self.native_strips[rectangle.height], self.alternate_strips[rectangle.height]
 
     def native_search(self,rectangle):
         '''
         Returns if the rect can fit in (all of) its native rows 
         '''
-        if rectangle.height in [13,14,15]:
-            rec_height = 16
-        else:
-            rec_height = rectangle.height
-        
-        for strip_num, strip_h in enumerate(self.strip_heights):
-            # if the height of the rectangle is the lane height and there is space to fit
-            if (strip_h == rec_height):
-                ret =  self.check_if_rect_fits_in_strip(strip_num, rectangle)
-                if ret != (None, None):
-                    return ret
+        native_strips, alternate_strips = self.candidate_strips(rectangle)
+        for strip_num in native_strips:
+            # if there is space to fit in the lane
+            ret =  self.check_if_rect_fits_in_strip(strip_num, rectangle)
+            if ret != (None, None):
+                return ret
 
         return None, None
 
@@ -182,20 +743,24 @@ class CustomPolicy(Container):
         for a given strip checks if the rectangle fits in the strip, with a consideration
         for invalid range in that strip
         '''
+        instr = self.instrumentation
         if self.invalid_range[strip_num] is not None:
-            self.perf_counters['EQUIFILL']['INVALID_2_OPS']      += 1
+            if instr.enabled:
+                instr.count('EQUIFILL.INVALID_2_OPS')
+                instr.count('EQUIFILL.ADD_AND_COMP')
             #BEFORE THE INVALID BLOCK
-            self.perf_counters['EQUIFILL']['ADD_AND_COMP'] += 1
             if(self.occupied_strip_width[strip_num] + rectangle.width <= self.invalid_range[strip_num][0]):
                 return strip_num, -1
             #AFTER THE INVALID BLOCK
-            self.perf_counters['EQUIFILL']['ADD_AND_COMP'] += 1
+            if instr.enabled:
+                instr.count('EQUIFILL.ADD_AND_COMP')
             if(self.invalid_range[strip_num][1] + rectangle.width <= self.width):
                 return strip_num, 1
         else:
-            self.perf_counters['EQUIFILL']['NON-INVALID_1_OP']  += 1
+            if instr.enabled:
+                instr.count('EQUIFILL.NON-INVALID_1_OP')
+                instr.count('EQUIFILL.ADD_AND_COMP')
             #NO INVALID BLOCK PRESENT
-            self.perf_counters['EQUIFILL']['ADD_AND_COMP'] += 1
             if(self.occupied_strip_width[strip_num] + rectangle.width <= self.width):
                 return strip_num, None
         return None, None
@@ -206,30 +771,24 @@ class CustomPolicy(Container):
         the alternative height strips.
         Selects the one which is lesser filled globally 
         '''
-        if rectangle.height in [13,14,15]:
-            rec_height = 16
-        else:
-            rec_height = rectangle.height
+        native_strips, alternate_strips = self.candidate_strips(rectangle)
+        instr = self.instrumentation
+        if instr.enabled:
+            instr.count('EQUIFILL.NATIVE', len(native_strips))
+            instr.count('EQUIFILL.ALTERNATE', len(alternate_strips))
         
         possible_strip_index = []
         #native strip heights SEARCH
-        for strip_num, strip_h in enumerate(self.strip_heights):
-            if strip_h == rec_height:
-                self.perf_counters['EQUIFILL']['NATIVE']      += 1
-                ret =  self.check_if_rect_fits_in_strip(strip_num, rectangle)
-                if ret != (None, None):
-                    possible_strip_index.append(strip_num)
+        for strip_num in native_strips:
+            ret =  self.check_if_rect_fits_in_strip(strip_num, rectangle)
+            if ret != (None, None):
+                possible_strip_index.append(strip_num)
                 
         #alternate strip heights SEARCH
-        for strip_num, strip_h_l in enumerate(self.strip_alternate_heights):
-            for strip_h in strip_h_l:
-                if strip_h == rec_height:
-                    self.perf_counters['EQUIFILL']['ALTERNATE']      += 1
-                    ret =  self.check_if_rect_fits_in_strip(strip_num, rectangle)
-                    if ret != (None, None):
-                        #ignore blocks in which invalid block is present - NOT NEEDED
-                        # if (ret[1] is None or (ret[1] is not None and ret[1]<0)):
-                        possible_strip_index.append(strip_num)
+        for strip_num in alternate_strips:
+            ret =  self.check_if_rect_fits_in_strip(strip_num, rectangle)
+            if ret != (None, None):
+                possible_strip_index.append(strip_num)
         
         if len(possible_strip_index) != 0:
             # EQUIFILL SEARCH SUCCESSFUL
@@ -249,84 +808,89 @@ class CustomPolicy(Container):
     def alternate_search(self, rectangle):
         '''
         Starting from the bottom, looks from a strip group (2 or 1 strip)
-        where is enough width space to fit incoming rectangle
+        where is enough width space to fit incoming rectangle, among the
+        groups at least as high as it
         '''
-        self.perf_counters['ALTERNATE']['INITIATED'] += 1
-        for strip_grp_num, values_l in enumerate(self.strip_grouping):
-            if len(values_l) == 2:
-                # if even strip has invalid
-                if self.invalid_range[strip_grp_num*2] is not None:
-                    strip_occupied_e = self.invalid_range[strip_grp_num*2][1]
-                else:
-                    strip_occupied_e = self.occupied_strip_width[strip_grp_num*2]
-                
-                # if odd strip has invalid
-                if self.invalid_range[strip_grp_num*2+1] is not None:
-                    strip_occupied_o = self.invalid_range[strip_grp_num*2+1][1]
-                else:
-                    strip_occupied_o = self.occupied_strip_width[strip_grp_num*2+1]
-
-                self.perf_counters['ALTERNATE']['MAX_OPERATION'] += 1
-                max_occupied_width = max(strip_occupied_e, strip_occupied_o)
-                self.perf_counters['ALTERNATE']['ADD_AND_COMP'] += 1
-                if (rectangle.width <= self.width - max_occupied_width):
-                    return strip_grp_num
-            else: #fill into 16 blocks
-                index = strip_grp_num - self.NUM_STRIP_GROUPS
-                self.perf_counters['ALTERNATE']['ADD_AND_COMP'] += 1
-                if (rectangle.width <= self.width - self.occupied_strip_width[index]):
-                    print("placing in 16 blocks at ", index)
-                    return strip_grp_num
-
-        return None
+        fit = bisect.bisect_left(self.fit_heights, rectangle.height)
+        if fit == len(self.fit_heights):
+            strip_grp_num = None
+        else:
+            strip_grp_num = self.group_free[self.fit_heights[fit]].leftmost_above(rectangle.width - 1)
+
+        instr = self.instrumentation
+        if instr.enabled:
+            # ops are counted as a scan from the bottom group would do them
+            scanned = self.NUM_STRIP_GROUPS if strip_grp_num is None else strip_grp_num + 1
+            instr.count('ALTERNATE.INITIATED')
+            instr.count('ALTERNATE.MAX_OPERATION', min(scanned, self.LARGEST_STRIP_GRP_INDEX))
+            instr.count('ALTERNATE.ADD_AND_COMP', scanned)
+        return strip_grp_num
     
+    def in_bounds(self, x, y, rectangle):
+        '''
+        Checks a position against the container width and the top of the
+        lane layout
+        '''
+        return x + rectangle.width <= self.width and y + rectangle.height <= self.layout_height
+
     def fixed_lane_packing(self, rectangle):
         max_x = self.width - rectangle.width
         max_y = self.height - rectangle.height
         if max_x < 0 or max_y < 0:
             return None, None  # Rectangle is too large to fit
 
+        instr = self.instrumentation
+
         # EQUIFILL - SEARCH
+        if instr.timing:
+            start = instr.clock()
         strip_num, loc = self.equi_fill_search(rectangle)
-        print(rectangle.height, strip_num)
+        if instr.timing:
+            instr.phase_time('EQUIFILL', instr.clock() - start)
         if strip_num is not None:
-            # EQUIFILL - UPDATION
-            if (loc == None or loc<0):
+            if loc == None or loc < 0:
                 # (1) there is no invalid range in the strip, place the rect regularly
                 # (2) we are placing the new block before the invalid range
-                occupied_strip_width = self.occupied_strip_width[strip_num]
-                self.occupied_strip_width[strip_num] = self.occupied_strip_width[strip_num] + rectangle.width
-                return occupied_strip_width, self.strip_height_off[strip_num]
-            elif(loc>0):
-                #extend the invalid range and dont change the occupied_strip_width for the strip
-                starting_pt = self.invalid_range[strip_num][1]
-                self.invalid_range[strip_num][1] = self.invalid_range[strip_num][1] + rectangle.width
-                return starting_pt, self.strip_height_off[strip_num]
-
+                x = self.occupied_strip_width[strip_num]
+            else:
+                # after the invalid range, which is extended over the rect
+                x = self.invalid_range[strip_num][1]
+            y = self.strip_height_off[strip_num]
+            if self.in_bounds(x, y, rectangle):
+                # EQUIFILL - UPDATION, only once the position is known to be good
+                if self.undo_log is not None:
+                    self.log_strip(strip_num)
+                if loc == None or loc < 0:
+                    self.occupied_strip_width[strip_num] = x + rectangle.width
+                else:
+                    #extend the invalid range and dont change the occupied_strip_width for the strip
+                    self.invalid_range[strip_num][1] = x + rectangle.width
+                self.refresh_group(strip_num)
+                return x, y
 
         # ALTERNATE - SEARCH
+        if instr.timing:
+            start = instr.clock()
         strip_grp_num = self.alternate_search(rectangle)
-        print("ALTERNATE", rectangle.height, strip_grp_num)
+        if instr.timing:
+            instr.phase_time('ALTERNATE', instr.clock() - start)
         if strip_grp_num is not None:
-            # ALTERNATE - UPDATION
-            if strip_grp_num < self.LARGEST_STRIP_GRP_INDEX:
-                even_row_num, odd_row_num = 2*strip_grp_num, 2*strip_grp_num+1
-
-                if self.invalid_range[even_row_num] is not None:
-                    strip_fill_even = self.invalid_range[even_row_num][1]   #end of invalid
-                else:
-                    strip_fill_even = self.occupied_strip_width[even_row_num]
-                if self.invalid_range[odd_row_num] is not None:
-                    strip_fill_odd = self.invalid_range[odd_row_num][1]    #end of invalid
-                else:
-                    strip_fill_odd = self.occupied_strip_width[odd_row_num]
+            strips = self.group_strips[strip_grp_num]
+            max_occupied_width = max(self.strip_end(strip_num) for strip_num in strips)
+            y = self.strip_height_off[strips[0]]
+            if not self.in_bounds(max_occupied_width, y, rectangle):
+                return None, None
 
-                max_occupied_width = max(strip_fill_odd, strip_fill_even)
-                
+            # ALTERNATE - UPDATION
+            if len(strips) == 2:
                 #update both the strips in the group
-                for index in [even_row_num, odd_row_num]:
+                for index in strips:
+                    if self.undo_log is not None:
+                        self.log_strip(index)
                     if self.invalid_range[index] is not None:
-                        self.invalid_range[index][1] += rectangle.width
+                        # the invalid block grows over the rect, which may
+                        # start past its end when the other strip is fuller
+                        self.invalid_range[index][1] = max_occupied_width + rectangle.width
                     else:
                         # no invalid is present already
                         if (max_occupied_width != self.occupied_strip_width[index]):
@@ -335,13 +899,26 @@ class CustomPolicy(Container):
                         else:
                             #just extend the fill percentage
                             self.occupied_strip_width[index] += rectangle.width
-
-                return max_occupied_width, self.strip_height_off[even_row_num]
             else: # 16 blocks
-                index = strip_grp_num - self.NUM_STRIP_GROUPS
-                max_occupied_width = self.occupied_strip_width[index]
+                index = strips[0]
+                if self.undo_log is not None:
+                    self.log_strip(index)
                 self.occupied_strip_width[index] = max_occupied_width + rectangle.width
-                return max_occupied_width, self.strip_height_off[index]
+            self.refresh_group(strips[0])
+            return max_occupied_width, y
 
         # FAILED - couldn't place
-        return None, None
\ No newline at end of file
+        return None, None
+
+POLICIES = {policy.name.lower(): policy for policy in
+            [RandomizedPolicy, FFDHPolicy, BFDHPolicy, BottomLeftPolicy, SkylinePolicy, MaxRectsPolicy,
+             CustomPolicy]}
+
+def get_policy(name):
+    '''
+    Returns the policy class with the given name (case insensitive)
+    '''
+    try:
+        return POLICIES[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown policy {name!r}, expected one of {', '.join(POLICIES)}") from None
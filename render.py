@@ -0,0 +1,137 @@
+'''
+Incremental rendering of the placements of a container.
+
+The layout is drawn into a persistent raster of palette indices, one
+rectangle at a time, so each frame only costs the new rectangle. Frames
+are streamed either to a directory of PNGs or to a single animated GIF
+whose frames hold just the region of the new rectangle.
+'''
+import os
+import numpy as np
+
+BACKGROUND, EDGE = 0, 1
+# palette: white background, black edges, then the red shades used by
+# Container.visualize for the rect placed i-th out of n: (i/n, 0, 0)
+NUM_SHADES = 254
+PALETTE = np.zeros((256, 3), dtype=np.uint8)
+PALETTE[BACKGROUND] = (255, 255, 255)
+PALETTE[2:, 0] = np.linspace(0, 255, NUM_SHADES).round().astype(np.uint8)
+
+def shade(i, num):
+    return 2 + round(i / num * (NUM_SHADES - 1)) if num else 2
+
+class FrameRenderer:
+    '''
+    Raster of palette indices, scale pixels per container unit, with the
+    container origin at the bottom left like the matplotlib plots
+    '''
+    def __init__(self, width, height, scale=4):
+        self.scale = scale
+        self.raster = np.full((height*scale + 1, width*scale + 1), BACKGROUND, dtype=np.uint8)
+        self.box(0, 0, width, height)
+
+    def box(self, x, y, width, height):
+        '''
+        Draws the outline of a rect, returns its pixel region (row and col slices)
+        '''
+        s = self.scale
+        rows, cols = slice(y*s, (y+height)*s + 1), slice(x*s, (x+width)*s + 1)
+        region = self.raster[rows, cols]
+        region[[0, -1], :] = EDGE
+        region[:, [0, -1]] = EDGE
+        return rows, cols
+
+    def draw(self, x, y, width, height, color):
+        rows, cols = self.box(x, y, width, height)
+        self.raster[rows.start+1:rows.stop-1, cols.start+1:cols.stop-1] = color
+        return rows, cols
+
+    def frame(self):
+        # flip so that y grows upwards
+        return self.raster[::-1]
+
+class PngFrameWriter:
+    '''
+    Writes every frame to directory/frame_<i>.png
+    '''
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.num_frames = 0
+
+    def write(self, renderer, rows, cols):
+        from PIL import Image
+        image = Image.fromarray(renderer.frame(), 'P')
+        image.putpalette(PALETTE.tobytes())
+        image.save(os.path.join(self.directory, f"frame_{self.num_frames}.png"), compress_level=1)
+        self.num_frames += 1
+
+    def close(self):
+        pass
+
+class GifFrameWriter:
+    '''
+    Streams an animated GIF to path. The first frame is the whole raster,
+    every following frame only the pixels of the rect drawn since, which
+    the viewer composites over the previous frames
+    '''
+    def __init__(self, path, duration_ms=40, loop=0):
+        self.file = open(path, 'wb')
+        self.params = {'duration': duration_ms, 'disposal': 1}
+        self.loop = loop
+        self.num_frames = 0
+
+    def image(self, pixels):
+        from PIL import Image
+        image = Image.fromarray(np.ascontiguousarray(pixels), 'P')
+        image.putpalette(PALETTE.tobytes())
+        return image
+
+    def write(self, renderer, rows, cols):
+        from PIL import GifImagePlugin
+        if self.num_frames == 0:
+            image = self.image(renderer.frame())
+            header, _ = GifImagePlugin.getheader(image, PALETTE.tobytes(), {'loop': self.loop, 'optimize': False})
+            self.file.writelines(header)
+            self.file.writelines(GifImagePlugin.getdata(image, **self.params))
+        else:
+            # region of the rect in the flipped frame
+            num_rows = renderer.raster.shape[0]
+            top = num_rows - rows.stop
+            image = self.image(renderer.raster[rows, cols][::-1])
+            self.file.writelines(GifImagePlugin.getdata(image, offset=(cols.start, top), **self.params))
+        self.num_frames += 1
+
+    def close(self):
+        self.file.write(b';')
+        self.file.close()
+
+def render_frames(width, height, rectangles, path, every=1, scale=4, duration_ms=40):
+    '''
+    Renders one frame every `every` placements, plus the final layout.
+    rectangles is any sequence of Rectangles (e.g. a PlacementStore).
+    A path ending in .gif gives one animated file, anything else a
+    directory of PNG frames. Returns the number of frames written
+    '''
+    renderer = FrameRenderer(width, height, scale)
+    if path.endswith('.gif'):
+        writer = GifFrameWriter(path, duration_ms)
+    else:
+        writer = PngFrameWriter(path)
+
+    num = len(rectangles)
+    pending = None
+    try:
+        if num == 0:
+            writer.write(renderer, slice(0, 0), slice(0, 0))
+        for i, rect in enumerate(rectangles):
+            region = renderer.draw(rect.x, rect.y, rect.width, rect.height, shade(i, num))
+            pending = region if pending is None else (
+                slice(min(pending[0].start, region[0].start), max(pending[0].stop, region[0].stop)),
+                slice(min(pending[1].start, region[1].start), max(pending[1].stop, region[1].stop)))
+            if (i + 1) % every == 0 or i == num - 1:
+                writer.write(renderer, *pending)
+                pending = None
+    finally:
+        writer.close()
+    return writer.num_frames
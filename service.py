@@ -0,0 +1,393 @@
+'''
+Local packing service. Clients send JSON lines over TCP or a Unix socket:
+
+    {"id": 1, "policy": "skyline", "width": 128, "height": 128,
+     "rectangles": [[10, 12], [20, 5]], "kwargs": {}}
+
+and get back, in completion order,
+
+    {"id": 1, "xs": [0, 10], "ys": [0, 0], "utilization": 1.34, "latency_us": 850}
+
+with x = y = -1 for unplaced rects, or {"id": 1, "error": "..."}.
+{"id": 2, "op": "stats"} returns the service counters and latency
+percentiles. Requests are collected into micro-batches (up to batch_size
+requests, or what arrived within batch_wait_ms) and packed in a pool of
+warm worker processes, each with its own PackingCache. The request queue
+is bounded, at most max_inflight batches are in the pool at a time, and
+a connection has at most max_pipelined requests unanswered before its next
+line is read, so a flood of requests stops being read from the sockets
+instead of piling up in memory. Requests are validated before they are
+queued (see parse_job), and a pool a worker died in is replaced.
+
+    python service.py serve --port 8765 --workers 4
+    python service.py client --port 8765 --requests 1000
+'''
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+
+from cache import PackingCache, cached_pack
+from instrumentation import Instrumentation
+from policies import get_policy
+
+DEFAULT_PORT = 8765
+
+# results of the batches packed by this process, when it is a worker
+WORKER_CACHE = PackingCache(max_entries=256)
+
+def pack_batch(jobs):
+    '''
+    Packs (policy name, width, height, sizes, kwargs) jobs in a worker.
+    Returns (xs, ys, utilization, error) for every job
+    '''
+    results = []
+    for policy_name, width, height, sizes, kwargs in jobs:
+        try:
+            sizes = np.array(sizes, dtype=np.int64).reshape(-1, 2)
+            xs, ys = cached_pack(WORKER_CACHE, get_policy(policy_name), width, height, sizes, **kwargs)
+            used_area = int((sizes[:, 0] * sizes[:, 1])[xs >= 0].sum())
+            results.append((xs.tolist(), ys.tolist(), used_area / (width * height) * 100, None))
+        except Exception as e:
+            results.append((None, None, None, f"{type(e).__name__}: {e}"))
+    return results
+
+def warm_up():
+    return os.getpid()
+
+# largest container side a request may ask for: the skyline and random
+# policies allocate per column and per cell of the container
+MAX_SIDE = 4096
+
+def positive_int(value):
+    value = int(value)
+    if value <= 0:
+        raise ValueError(f"{value} is not positive")
+    return value
+
+def lane_layout(value):
+    return [[positive_int(lane) for lane in group] for group in value]
+
+def flag(value):
+    if not isinstance(value, bool):
+        raise TypeError(f"{value!r} is not a boolean")
+    return value
+
+# policy name -> the kwargs a request may pass it, with their validators.
+# layout_file is left out: it would make a worker open any path
+POLICY_KWARGS = {'random': {'batched': flag},
+                 'custom': {'strip_grouping': lane_layout, 'min_lane': positive_int}}
+
+def parse_job(message):
+    '''
+    Validates a request in the server, so bad ones never reach the pool:
+    positive sizes, container sides up to MAX_SIDE and only the kwargs of
+    POLICY_KWARGS
+    '''
+    policy = get_policy(message['policy'])
+    width, height = positive_int(message['width']), positive_int(message['height'])
+    if width > MAX_SIDE or height > MAX_SIDE:
+        raise ValueError(f"container {width}x{height} is larger than {MAX_SIDE}x{MAX_SIDE}")
+    sizes = [(positive_int(w), positive_int(h)) for w, h in message['rectangles']]
+
+    allowed = POLICY_KWARGS.get(policy.name, {})
+    kwargs = {}
+    for name, value in dict(message.get('kwargs') or {}).items():
+        if name not in allowed:
+            raise ValueError(f"{policy.name} does not take the kwarg {name!r}")
+        kwargs[name] = allowed[name](value)
+    return message['policy'], width, height, sizes, kwargs
+
+class PackingService:
+    def __init__(self, workers=None, batch_size=32, batch_wait_ms=2, max_queue=1024, max_inflight=None,
+                 max_pipelined=64):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pipelined = max_pipelined
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1e3
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.inflight = asyncio.Semaphore(max_inflight or 2 * self.workers)
+        self.pool = None
+        self.batcher = None
+        # dispatch tasks of the batches in the pool
+        self.dispatches = set()
+        # REQUESTS, ERRORS, BATCHES, BATCHED, POOL_RESTARTS counters, QUEUE and PACK
+        # phase times and the request latency histogram
+        self.metrics = Instrumentation(timing=True)
+
+    async def start(self):
+        await self.start_pool()
+        self.batcher = asyncio.create_task(self.run_batcher())
+
+    async def start_pool(self):
+        loop = asyncio.get_running_loop()
+        self.pool = pool = ProcessPoolExecutor(max_workers=self.workers)
+        # pay the process start and the imports before the first request
+        await asyncio.gather(*(loop.run_in_executor(pool, warm_up) for _ in range(self.workers)))
+
+    async def replace_pool(self, broken):
+        '''
+        Replaces the pool after a worker died, once for all the batches
+        that were in the broken one
+        '''
+        if self.pool is not broken:
+            return
+        self.metrics.count('POOL_RESTARTS')
+        broken.shutdown(wait=False, cancel_futures=True)
+        await self.start_pool()
+
+    async def close(self):
+        if self.batcher is not None:
+            self.batcher.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def submit(self, job):
+        '''
+        Queues a job (waiting while the queue is full) and returns the
+        future of its (xs, ys, utilization, error)
+        '''
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((job, future, time.perf_counter_ns()))
+        return future
+
+    async def run_batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self.queue.get_nowait())
+
+            await self.inflight.acquire()
+            task = asyncio.create_task(self.dispatch(batch))
+            self.dispatches.add(task)
+            task.add_done_callback(self.dispatches.discard)
+
+    async def dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter_ns()
+        for _, _, queued in batch:
+            self.metrics.phase_time('QUEUE', start - queued)
+        self.metrics.count('BATCHES')
+        self.metrics.count('BATCHED', len(batch))
+        pool = self.pool
+        try:
+            results = await loop.run_in_executor(pool, pack_batch, [job for job, _, _ in batch])
+        except BrokenProcessPool as e:
+            # a worker died (killed or out of memory): the batch is lost,
+            # but the next ones go to a new pool
+            results = [(None, None, None, f"{type(e).__name__}: {e}")] * len(batch)
+            await self.replace_pool(pool)
+        except Exception as e:
+            results = [(None, None, None, f"{type(e).__name__}: {e}")] * len(batch)
+        finally:
+            self.inflight.release()
+        self.metrics.phase_time('PACK', time.perf_counter_ns() - start)
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        metrics = self.metrics
+        batches = metrics.counters['BATCHES']
+        return {'requests'        : metrics.counters['REQUESTS'],
+                'errors'          : metrics.counters['ERRORS'],
+                'batches'         : batches,
+                'pool_restarts'   : metrics.counters['POOL_RESTARTS'],
+                'mean_batch_size' : metrics.counters['BATCHED'] / batches if batches else 0,
+                'queued'          : self.queue.qsize(),
+                'mean_queue_us'   : metrics.phase_ns['QUEUE'] / max(1, metrics.phase_calls['QUEUE']) / 1e3,
+                'mean_pack_us'    : metrics.phase_ns['PACK'] / max(1, metrics.phase_calls['PACK']) / 1e3,
+                'p50_us'          : metrics.latency_percentile(50) / 1e3,
+                'p90_us'          : metrics.latency_percentile(90) / 1e3,
+                'p99_us'          : metrics.latency_percentile(99) / 1e3}
+
+    async def respond(self, message, received):
+        request_id = message.get('id') if isinstance(message, dict) else None
+        try:
+            if message.get('op') == 'stats':
+                return {'id': request_id, **self.stats()}
+            job = parse_job(message)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            self.metrics.count('ERRORS')
+            return {'id': request_id, 'error': f"bad request: {type(e).__name__}: {e}"}
+
+        self.metrics.count('REQUESTS')
+        xs, ys, utilization, error = await (await self.submit(job))
+        latency = time.perf_counter_ns() - received
+        self.metrics.record_latency(latency)
+        if error is not None:
+            self.metrics.count('ERRORS')
+            return {'id': request_id, 'error': error}
+        return {'id': request_id, 'xs': xs, 'ys': ys, 'utilization': utilization, 'latency_us': latency // 1000}
+
+    async def handle_connection(self, reader, writer):
+        async def answer(line, received):
+            try:
+                message = json.loads(line)
+            except ValueError as e:
+                self.metrics.count('ERRORS')
+                response = {'id': None, 'error': f"bad request: {e}"}
+            else:
+                response = await self.respond(message, received)
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+        def done(task):
+            tasks.discard(task)
+            pipelined.release()
+
+        tasks = set()
+        pipelined = asyncio.Semaphore(self.max_pipelined)
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    # answered concurrently, so a connection can pipeline
+                    # requests, but no more than max_pipelined at a time
+                    received = time.perf_counter_ns()
+                    await pipelined.acquire()
+                    task = asyncio.create_task(answer(line, received))
+                    tasks.add(task)
+                    task.add_done_callback(done)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+async def start_server(service, host='127.0.0.1', port=DEFAULT_PORT, path=None):
+    '''
+    Starts the service and listens on a Unix socket at path, or on host:port
+    '''
+    await service.start()
+    if path is not None:
+        return await asyncio.start_unix_server(service.handle_connection, path, limit=2**26)
+    return await asyncio.start_server(service.handle_connection, host, port, limit=2**26)
+
+class PackingClient:
+    '''
+    Client of the service. Requests can be issued concurrently over the
+    one connection, the responses are matched to them by id
+    '''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count()
+        self.pending = {}
+        self.receiver = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=DEFAULT_PORT, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=2**26)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=2**26)
+        return cls(reader, writer)
+
+    async def receive(self):
+        try:
+            while line := await self.reader.readline():
+                response = json.loads(line)
+                future = self.pending.pop(response.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("service closed the connection"))
+
+    async def request(self, message):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(json.dumps({**message, 'id': request_id}).encode() + b'\n')
+        await self.writer.drain()
+        return await future
+
+    async def pack(self, policy, width, height, rectangles, **kwargs):
+        '''
+        Returns the response of packing (width, height) pairs or Rectangles
+        '''
+        sizes = [(int(r.width), int(r.height)) if hasattr(r, 'width') else (int(r[0]), int(r[1]))
+                 for r in rectangles]
+        return await self.request({'policy': policy, 'width': width, 'height': height,
+                                   'rectangles': sizes, 'kwargs': kwargs})
+
+    async def stats(self):
+        return await self.request({'op': 'stats'})
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+async def serve(args):
+    service = PackingService(args.workers, args.batch_size, args.batch_wait_ms, args.max_queue,
+                             max_pipelined=args.max_pipelined)
+    server = await start_server(service, args.host, args.port, args.unix)
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"packing service on {where} with {service.workers} workers")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+async def run_client(args):
+    client = await PackingClient.connect(args.host, args.port, args.unix)
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        sizes = [(rng.randint(4, 16), rng.randint(4, 16)) for _ in range(args.count)]
+        async with semaphore:
+            return await client.pack(args.policy, args.width, args.height, sizes)
+
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    errors = [response['error'] for response in responses if 'error' in response]
+    print(f"{len(responses)} requests in {elapsed:.2f}s ({len(responses)/elapsed:.0f}/s), {len(errors)} errors")
+    if errors:
+        print(errors[0])
+    print(json.dumps(await client.stats(), indent=1))
+    await client.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['serve', 'client'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', help="Unix socket path, instead of host and port")
+    parser.add_argument('--workers', type=int, help="worker processes, all cores by default")
+    parser.add_argument('--batch-size', type=int, default=32, help="most requests per batch")
+    parser.add_argument('--batch-wait-ms', type=float, default=2, help="longest wait to fill a batch")
+    parser.add_argument('--max-queue', type=int, default=1024, help="queued requests before reading stops")
+    parser.add_argument('--max-pipelined', type=int, default=64,
+                        help="unanswered requests of a connection before reading it stops")
+    # client
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--policy', default='skyline')
+    parser.add_argument('--width', type=int, default=128)
+    parser.add_argument('--height', type=int, default=128)
+    parser.add_argument('--count', type=int, default=200, help="rectangles per request")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(serve(args) if args.command == 'serve' else run_client(args))
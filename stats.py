@@ -0,0 +1,111 @@
+'''
+Stats files of app.multiple_runs: one row per run with the seed, the
+utilization, the number of placed rectangles and the policy counters.
+
+The binary format is a .npy file of a structured array, written one row at
+a time and opened with memory mapping, so columns can be read as arrays
+without parsing, e.g. read_stats(path)['util'].mean().
+'''
+import csv
+import struct
+import numpy as np
+
+MAGIC = b'\x93NUMPY\x01\x00'
+
+def stats_dtype(columns):
+    return np.dtype([(name, np.float64 if name == 'util' else np.int64) for name in columns])
+
+class NpyStatsWriter:
+    '''
+    Appends rows to a .npy file. The header is padded to a fixed length
+    so that the row count in it can be rewritten in place. It is rewritten
+    every flush_rows rows and on close, so a file read while the runs go
+    on holds the rows up to the last flush
+    '''
+    def __init__(self, path, columns, flush_rows=256):
+        self.dtype = stats_dtype(columns)
+        self.num_rows = 0
+        self.flush_rows = flush_rows
+        # room for the largest row count
+        self.header_len = len(self.header(2**63 - 1)) + 1
+        self.header_len += -(len(MAGIC) + 2 + self.header_len) % 64
+        self.file = open(path, 'wb')
+        self.write_header()
+
+    def header(self, num_rows):
+        return repr({'descr': np.lib.format.dtype_to_descr(self.dtype),
+                     'fortran_order': False,
+                     'shape': (num_rows,)})
+
+    def write_header(self):
+        header = self.header(self.num_rows).ljust(self.header_len - 1) + '\n'
+        self.file.seek(0)
+        self.file.write(MAGIC + struct.pack('<H', self.header_len) + header.encode('latin1'))
+        self.file.seek(0, 2)
+
+    def write(self, row):
+        self.file.write(np.array(tuple(row), dtype=self.dtype).tobytes())
+        self.num_rows += 1
+        if self.num_rows % self.flush_rows == 0:
+            self.flush()
+
+    def flush(self):
+        self.write_header()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CsvStatsWriter:
+    '''
+    The text format, one comma separated row per run without a header
+    '''
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_stats_writer(path, columns):
+    '''
+    Binary writer for .npy paths, csv otherwise
+    '''
+    if path.endswith('.npy'):
+        return NpyStatsWriter(path, columns)
+    return CsvStatsWriter(path, columns)
+
+def read_stats(path):
+    '''
+    Memory maps a .npy stats file, or parses a csv one into a 2d float array
+    '''
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return np.loadtxt(path, delimiter=',', ndmin=2)
+
+def column(stats, index):
+    '''
+    Column `index` of the stats as an array, for both formats
+    '''
+    if stats.dtype.names:
+        return stats[stats.dtype.names[index]]
+    return stats[:, index]
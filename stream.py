@@ -0,0 +1,167 @@
+'''
+Streams rectangles from a CSV or JSONL file (or stdin) through a packing
+policy and writes every placement as soon as it is made, e.g.
+
+    python stream.py rects.csv -o placements.csv --policy skyline
+    cat rects.jsonl | python stream.py --format jsonl --multi-bin > out.jsonl
+
+Input rows are "width,height" (extra columns and a header on the first
+line are ignored) or JSON lines {"width": w, "height": h} / [w, h]. A
+malformed row, or a size that is not positive, stops the stream with a
+ValueError giving its line number. Output rows are
+index, width, height, bin, x, y with x = y = -1 for unplaced rectangles.
+Memory is bounded by the packing state, not by the input size.
+'''
+import argparse
+import csv
+import itertools
+import json
+import sys
+
+import defines
+from base import Rectangle
+from multibin import MultiBinPacker
+from policies import POLICIES, get_policy
+
+OUTPUT_FIELDS = ['index', 'width', 'height', 'bin', 'x', 'y']
+
+def detect_format(file_name, first_line):
+    if file_name.endswith('.jsonl') or file_name.endswith('.json'):
+        return 'jsonl'
+    if file_name.endswith('.csv'):
+        return 'csv'
+    return 'jsonl' if first_line.lstrip().startswith(('{', '[')) else 'csv'
+
+def check_size(width, height):
+    if width <= 0 or height <= 0:
+        raise ValueError(f"size {width}x{height} is not positive")
+    return width, height
+
+def read_csv(lines):
+    reader = csv.reader(lines)
+    for row in reader:
+        if not row:
+            continue
+        try:
+            if len(row) < 2:
+                raise ValueError("expected width,height")
+            size = int(row[0]), int(row[1])
+        except ValueError as e:
+            if reader.line_num == 1:
+                continue  # header
+            raise ValueError(f"line {reader.line_num}: bad rectangle row {row!r}: {e}") from e
+        try:
+            size = check_size(*size)
+        except ValueError as e:
+            raise ValueError(f"line {reader.line_num}: bad rectangle row {row!r}: {e}") from e
+        yield size
+
+def read_jsonl(lines):
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            if isinstance(item, dict):
+                size = check_size(int(item['width']), int(item['height']))
+            else:
+                size = check_size(int(item[0]), int(item[1]))
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise ValueError(f"line {line_num}: bad rectangle {line!r}: {e}") from e
+        yield size
+
+def read_rectangles(lines, file_format):
+    '''
+    Lazily yields (width, height) from an iterator of lines
+    '''
+    return read_jsonl(lines) if file_format == 'jsonl' else read_csv(lines)
+
+class PlacementWriter:
+    def __init__(self, file, file_format):
+        self.file = file
+        self.file_format = file_format
+        if file_format == 'csv':
+            self.writer = csv.writer(file)
+            self.writer.writerow(OUTPUT_FIELDS)
+
+    def write(self, *row):
+        if self.file_format == 'csv':
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(dict(zip(OUTPUT_FIELDS, row))) + '\n')
+
+def stream_pack(sizes, packer, writer):
+    '''
+    Places every (width, height) from sizes with packer (a Container or a
+    MultiBinPacker) and writes the placement right away. Returns the
+    number of rectangles read and placed
+    '''
+    probe = Rectangle(0, 0, 0, 0)
+    num_read = num_placed = 0
+    for index, (width, height) in enumerate(sizes):
+        probe.width, probe.height = width, height
+        num_read += 1
+        if isinstance(packer, MultiBinPacker):
+            placement = packer.place_rectangle(probe)
+        elif packer.place_rectangle(probe):
+            placed = packer.rectangles
+            placement = 0, int(placed.x[-1]), int(placed.y[-1])
+        else:
+            placement = None
+
+        if placement is None:
+            writer.write(index, width, height, -1, -1, -1)
+        else:
+            num_placed += 1
+            writer.write(index, width, height, *placement)
+    return num_read, num_placed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?', default='-', help="rectangle file, - for stdin")
+    parser.add_argument('-o', '--output', default='-', help="placement file, - for stdout")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="input format, guessed by default")
+    parser.add_argument('--output-format', choices=['csv', 'jsonl'], help="defaults to the input format")
+    parser.add_argument('--policy', default='custom', choices=sorted(POLICIES))
+    parser.add_argument('--width', type=int, default=defines.container_width)
+    parser.add_argument('--height', type=int, default=defines.container_height)
+    parser.add_argument('--multi-bin', action='store_true', help="open new bins instead of rejecting rectangles")
+    parser.add_argument('--max-tries', type=int, default=4, help="bins tried per rectangle with --multi-bin")
+    args = parser.parse_args(argv)
+
+    in_file = sys.stdin if args.input == '-' else open(args.input, newline='')
+    out_file = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        first_line = in_file.readline()
+        file_format = args.format or detect_format(args.input, first_line)
+        lines = itertools.chain([first_line], in_file)
+
+        policy = get_policy(args.policy)
+        if args.multi_bin:
+            packer = MultiBinPacker(policy, args.width, args.height, max_tries=args.max_tries)
+        else:
+            packer = policy(args.width, args.height)
+
+        writer = PlacementWriter(out_file, args.output_format or file_format)
+        try:
+            num_read, num_placed = stream_pack(read_rectangles(lines, file_format), packer, writer)
+        except ValueError as e:
+            # the placements before the bad row are already written
+            sys.exit(f"{args.input}: {e}")
+    finally:
+        if in_file is not sys.stdin:
+            in_file.close()
+        if out_file is not sys.stdout:
+            out_file.close()
+
+    summary = f"placed {num_placed}/{num_read}"
+    if args.multi_bin:
+        summary += f" in {len(packer.bins)} bins"
+        num_invalid = sum(not report.ok for report in packer.verify())
+        if num_invalid:
+            summary += f", {num_invalid} with an invalid layout"
+    print(summary, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+'''
+Randomized checks of the packing core against simple references. Run them
+with pytest from the repository root, or one module at a time:
+
+    python -m pytest tests
+    python -m tests.test_rollback
+'''
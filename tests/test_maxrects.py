@@ -0,0 +1,99 @@
+'''
+Removal: the free rects MaxRectsPolicy keeps up to date as placements are
+added and removed, against the ones rebuilt from the placements alone, and
+checkpoints and rollbacks across removals
+'''
+import random
+import numpy as np
+
+from base import Rectangle
+from container import UnsupportedOperation
+from policies import MaxRectsPolicy, POLICIES, maximal_rects, split_free_rects
+
+def rebuilt_free_rects(container):
+    free = np.array([[0], [0], [container.width], [container.height]], dtype=np.int64)
+    for rect in container.rectangles:
+        hit, parts = split_free_rects(free, rect.x, rect.y, rect.width, rect.height)
+        keep = np.ones(free.shape[1], dtype=bool)
+        keep[hit] = False
+        free = maximal_rects(np.concatenate([free[:, keep], parts], axis=1))
+    return sorted(map(tuple, free.T.tolist()))
+
+def free_rects(container):
+    return sorted(map(tuple, container.free.T.tolist()))
+
+def box(rect):
+    return rect.x, rect.y, rect.width, rect.height
+
+def state(container):
+    placements = [box(rect) for rect in container.rectangles]
+    return placements, container.rectangles.ids.tolist(), container.free.T.tolist()
+
+def place_or_remove(container, rng, remove_rate, max_size):
+    if len(container.rectangles) and rng.random() < remove_rate:
+        container.remove(int(rng.choice(container.rectangles.ids)))
+    else:
+        container.place_rectangle(Rectangle(0, 0, rng.randint(1, max_size), rng.randint(1, max_size)))
+
+def test_free_rects():
+    rng = random.Random(0)
+    for trial in range(20):
+        container = MaxRectsPolicy(*rng.choice([(32, 32), (64, 48), (100, 100)]))
+        for step in range(150):
+            place_or_remove(container, rng, 0.35, 20)
+            assert free_rects(container) == rebuilt_free_rects(container), (trial, step)
+            assert container.verify().ok
+
+def test_rollback_across_removals():
+    rng = random.Random(1)
+    for trial in range(30):
+        container = MaxRectsPolicy(64, 64)
+        for _ in range(20):
+            place_or_remove(container, rng, 0, 16)
+        for _ in range(30):
+            mark = container.checkpoint()
+            before = state(container)
+            for _ in range(rng.randint(1, 6)):
+                place_or_remove(container, rng, 0.5, 16)
+            container.rollback(mark)
+            assert state(container) == before, trial
+            place_or_remove(container, rng, 0.5, 16)
+
+def test_stable_ids():
+    rng = random.Random(2)
+    container = MaxRectsPolicy(64, 64)
+    placed = {}
+    for _ in range(200):
+        if placed and rng.random() < 0.4:
+            placement_id = rng.choice(sorted(placed))
+            assert box(container.remove(placement_id)) == placed.pop(placement_id)
+        else:
+            rect = Rectangle(0, 0, rng.randint(1, 16), rng.randint(1, 16))
+            placement_id = container.place(rect)
+            if placement_id is not None:
+                assert placement_id not in placed
+                index = container.rectangles.index_of(placement_id)
+                placed[placement_id] = box(container.rectangles[index])
+        for placement_id, rect in placed.items():
+            assert box(container.rectangles[container.rectangles.index_of(placement_id)]) == rect
+
+def test_unsupported():
+    for policy in POLICIES.values():
+        container = policy(64, 64)
+        container.place_rectangle(Rectangle(0, 0, 10, 10))
+        if policy.supports_removal:
+            assert container.remove(0).width == 10 and len(container.rectangles) == 0
+        else:
+            try:
+                container.remove(0)
+            except UnsupportedOperation:
+                pass
+            else:
+                raise AssertionError(f"{policy.name} removed a placement")
+
+if __name__ == '__main__':
+    test_free_rects()
+    test_rollback_across_removals()
+    test_stable_ids()
+    test_unsupported()
+    print("maxrects ok")
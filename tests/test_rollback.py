@@ -0,0 +1,83 @@
+'''
+Rollback fuzz: random runs of placements, nested checkpoints, pack_all
+calls and commits, checking that every rollback restores the container
+state exactly and that a run with rollbacks places like one without
+'''
+import random
+import numpy as np
+
+from app import generate_random_rectangles
+from base import MaxSegmentTree, PlacementStore, Rectangle
+from policies import POLICIES
+
+# not compared: the policy callable, the undo log itself, and caches
+# rebuilt lazily from the rest of the state
+IGNORED = {'instrumentation', 'policy', 'undo_log', 'rng',
+           'by_basin', 'stale', 'grid', 'windows', 'grid_size', 'grid_version'}
+
+def normalized(value):
+    if isinstance(value, MaxSegmentTree):
+        tree = value.tree
+        for node in range(1, value.capacity):
+            assert tree[node] == max(tree[2*node], tree[2*node + 1])
+        assert all(tree[value.capacity + i] == MaxSegmentTree.EMPTY for i in range(value.size, value.capacity))
+        return ('tree', [value[i] for i in range(value.size)])
+    if isinstance(value, PlacementStore):
+        return [(rect.x, rect.y, rect.width, rect.height) for rect in value]
+    if isinstance(value, np.ndarray):
+        return ('array', value.tolist())
+    if isinstance(value, dict):
+        return {key: normalized(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(normalized(item) for item in value)
+    return value
+
+def state(container):
+    if hasattr(container, 'refresh_basins'):
+        container.refresh_basins()
+    return {key: normalized(value) for key, value in vars(container).items() if key not in IGNORED}
+
+def fuzz(policy, seed, num=300, **kwargs):
+    random.seed(seed)
+    rects = generate_random_rectangles(num, 4, 16, 4, 16)
+    rng = random.Random(seed)
+    container = policy(128, 128, **kwargs)
+    if hasattr(container, 'MAX_ITER'):
+        # the random policy gives up slowly once the container is full
+        container.MAX_ITER = 100
+    for i, rect in enumerate(rects):
+        if rng.random() < 0.5:
+            mark = container.checkpoint()
+            before = state(container)
+            marks = []
+            for other in rects[i:i + rng.randint(1, 8)]:
+                marks.append((container.checkpoint(), state(container)))
+                container.place_rectangle(other)
+            if rng.random() < 0.5:
+                inner_mark, inner_state = rng.choice(marks)
+                container.rollback(inner_mark)
+                assert state(container) == inner_state, (policy.name, seed, i)
+            if rng.random() < 0.3:
+                container.pack_all(rects[i:i + 3])
+            container.rollback(mark)
+            assert state(container) == before, (policy.name, seed, i)
+            if rng.random() < 0.2:
+                container.commit()
+        container.place_rectangle(rect)
+
+    if policy.deterministic:
+        reference = policy(128, 128)
+        for rect in rects:
+            reference.place_rectangle(Rectangle(0, 0, rect.width, rect.height))
+        assert normalized(reference.rectangles) == normalized(container.rectangles), (policy.name, seed)
+
+def test_rollback():
+    for policy in POLICIES.values():
+        for seed in range(5):
+            fuzz(policy, seed)
+    for seed in range(5):
+        fuzz(POLICIES['random'], seed, batched=True)
+
+if __name__ == '__main__':
+    test_rollback()
+    print("rollback ok")
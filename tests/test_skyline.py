@@ -0,0 +1,48 @@
+'''
+SkylinePolicy against a brute force search over the column heights: the
+lowest, then leftmost position where the rect rests on the skyline
+'''
+import random
+import numpy as np
+
+from base import Rectangle
+from policies import SkylinePolicy
+
+def brute_force_position(heights, container_height, width, height):
+    best = None
+    for x in range(len(heights) - width + 1):
+        y = max(heights[x:x + width])
+        if y + height <= container_height and (best is None or (y, x) < best):
+            best = (y, x)
+    return best
+
+def test_lowest_then_leftmost():
+    rng = random.Random(0)
+    for trial in range(300):
+        width, height = rng.randint(1, 64), rng.randint(1, 64)
+        max_size = rng.randint(1, 20)
+        container = SkylinePolicy(width, height)
+        heights = [0] * width
+        for step in range(rng.randint(1, 80)):
+            w, h = rng.randint(1, max_size), rng.randint(1, max_size)
+            expected = brute_force_position(heights, height, w, h) if w <= width else None
+            placed = container.place_rectangle(Rectangle(0, 0, w, h))
+            assert placed == (expected is not None), (trial, step)
+            if placed:
+                y, x = expected
+                assert (container.rectangles.x[-1], container.rectangles.y[-1]) == (x, y), (trial, step)
+                heights[x:x + w] = [y + h] * w
+
+def test_no_area():
+    # a rect of no width used to leave a segment of no width, and the
+    # next placement over it never ended
+    for sizes in [[(8, 8), (0, 5), (8, 8)], [(8, 8), (5, 0), (8, 8)], [(8, 8), (-3, 4), (8, 8)]]:
+        container = SkylinePolicy(32, 32)
+        assert [container.place_rectangle(Rectangle(0, 0, w, h)) for w, h in sizes] == [True, False, True]
+        xs, ys = SkylinePolicy(32, 32).pack_all(np.array(sizes))
+        assert xs.tolist() == [0, -1, 8] and ys.tolist() == [0, -1, 0]
+
+if __name__ == '__main__':
+    test_lowest_then_leftmost()
+    test_no_area()
+    print("skyline ok")
@@ -0,0 +1,47 @@
+'''
+verify_layout against an all pairs check, on random layouts with
+overlaps, touching edges, empty rects and out of bounds placements
+'''
+import random
+import numpy as np
+
+from verify import verify_layout
+
+def brute_force(width, height, xs, ys, widths, heights):
+    n = len(xs)
+    overlaps = []
+    for i in range(n):
+        for j in range(i + 1, n):
+            solid = widths[i] > 0 and heights[i] > 0 and widths[j] > 0 and heights[j] > 0
+            apart = xs[i] + widths[i] <= xs[j] or xs[j] + widths[j] <= xs[i] or \
+                    ys[i] + heights[i] <= ys[j] or ys[j] + heights[j] <= ys[i]
+            if solid and not apart:
+                overlaps.append((i, j))
+    out_of_bounds = [i for i in range(n) if xs[i] < 0 or ys[i] < 0 or
+                     xs[i] + widths[i] > width or ys[i] + heights[i] > height]
+    return overlaps, out_of_bounds
+
+def test_random_layouts():
+    rng = random.Random(0)
+    for trial in range(500):
+        n = rng.randint(0, 60)
+        width = height = rng.randint(5, 40)
+        xs = [rng.randint(-2, width) for _ in range(n)]
+        ys = [rng.randint(-2, height) for _ in range(n)]
+        widths = [rng.randint(0, 10) for _ in range(n)]
+        heights = [rng.randint(0, 10) for _ in range(n)]
+        report = verify_layout(width, height, xs, ys, widths, heights)
+        assert (report.overlaps, report.out_of_bounds) == brute_force(width, height, xs, ys, widths, heights), trial
+
+def test_touching_grid():
+    # every rect touches its neighbours, none overlap
+    n = 50
+    cells = np.arange(n) * 4
+    xs, ys = np.repeat(cells, n), np.tile(cells, n)
+    sizes = np.full(n * n, 4)
+    assert verify_layout(n * 4, n * 4, xs, ys, sizes, sizes).ok
+
+if __name__ == '__main__':
+    test_random_layouts()
+    test_touching_grid()
+    print("verify ok")
@@ -0,0 +1,151 @@
+'''
+Checks a layout for overlapping and out of bounds placements in
+O(n log n + overlaps), so it can run on every layout.
+
+A vertical line sweeps the rects by x. The rects the line crosses are kept
+in an interval index over y, and every rect entering the sweep is checked
+against them. Two rects overlap as in Rectangle.intersects: touching edges
+are not an overlap.
+'''
+import numpy as np
+
+class IntervalIndex:
+    '''
+    Set of half-open [start, end) intervals over compressed coordinates,
+    with O(log n + k) queries for the k intervals overlapping an interval.
+    An interval overlapping [start, end) either starts inside it, or
+    starts before it and contains start:
+    - a segment tree of interval counts by start coordinate gives the
+      ones starting in a range, descending only into non empty nodes
+    - a segment tree whose nodes hold the intervals covering them entirely
+      gives the ones containing a point, on the path from the root to it
+    The sets of keys are only kept for the coordinates and nodes that have
+    some, so the memory follows the intervals in the index, not the number
+    of coordinates
+    '''
+    def __init__(self, num_coords):
+        self.size = 1
+        while self.size < max(num_coords, 1):
+            self.size *= 2
+        self.start_count = [0] * (2*self.size)
+        self.starting    = {}  # start coordinate -> keys
+        self.covering    = {}  # node -> keys
+
+    def cover_nodes(self, start, end):
+        '''
+        Nodes whose ranges together make [start, end) exactly
+        '''
+        lo, hi = start + self.size, end + self.size
+        while lo < hi:
+            if lo & 1:
+                yield lo
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                yield hi
+            lo >>= 1
+            hi >>= 1
+
+    def count_start(self, start, n):
+        node = start + self.size
+        while node:
+            self.start_count[node] += n
+            node >>= 1
+
+    def add(self, key, start, end):
+        self.starting.setdefault(start, set()).add(key)
+        self.count_start(start, 1)
+        for node in self.cover_nodes(start, end):
+            self.covering.setdefault(node, set()).add(key)
+
+    @staticmethod
+    def discard(sets, index, key):
+        keys = sets[index]
+        keys.discard(key)
+        if not keys:
+            del sets[index]
+
+    def remove(self, key, start, end):
+        self.discard(self.starting, start, key)
+        self.count_start(start, -1)
+        for node in self.cover_nodes(start, end):
+            self.discard(self.covering, node, key)
+
+    def overlapping(self, start, end):
+        '''
+        Keys of the intervals overlapping [start, end)
+        '''
+        found = []
+        # containing start, but starting before it
+        node = start + self.size
+        while node:
+            found.extend(self.covering.get(node, ()))
+            node >>= 1
+        starting = self.starting.get(start, ())
+        found = [key for key in found if key not in starting]
+
+        # starting inside [start, end)
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, lo, width = stack.pop()
+            if self.start_count[node] == 0 or lo >= end or lo + width <= start:
+                continue
+            if width == 1:
+                found.extend(self.starting.get(lo, ()))
+                continue
+            half = width // 2
+            stack.append((2*node + 1, lo + half, half))
+            stack.append((2*node, lo, half))
+        return found
+
+class LayoutReport:
+    '''
+    overlaps: pairs (i, j), i < j, of placement indices that overlap
+    out_of_bounds: indices of placements not inside the container
+    '''
+    def __init__(self, overlaps, out_of_bounds):
+        self.overlaps = overlaps
+        self.out_of_bounds = out_of_bounds
+
+    @property
+    def ok(self):
+        return not self.overlaps and not self.out_of_bounds
+
+    def __repr__(self):
+        return f"LayoutReport({len(self.overlaps)} overlaps, {len(self.out_of_bounds)} out of bounds)"
+
+def verify_layout(width, height, xs, ys, widths, heights):
+    '''
+    Checks the placements given as x, y, width and height arrays against
+    each other and against a width x height container
+    '''
+    xs, ys = np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.int64)
+    widths, heights = np.asarray(widths, dtype=np.int64), np.asarray(heights, dtype=np.int64)
+    ends_x, ends_y = xs + widths, ys + heights
+
+    out_of_bounds = np.flatnonzero((xs < 0) | (ys < 0) | (ends_x > width) | (ends_y > height)).tolist()
+
+    # rects of zero area overlap nothing
+    solid = np.flatnonzero((widths > 0) & (heights > 0))
+    coords = np.unique(np.concatenate([ys[solid], ends_y[solid]]))
+    starts = np.searchsorted(coords, ys).tolist()
+    ends = np.searchsorted(coords, ends_y).tolist()
+
+    # events by x, rects leaving the sweep before the ones entering it at
+    # the same x, since touching rects do not overlap
+    event_x = np.concatenate([ends_x[solid], xs[solid]])
+    event_kind = np.concatenate([np.zeros(len(solid), dtype=np.int64), np.ones(len(solid), dtype=np.int64)])
+    event_rect = np.concatenate([solid, solid])
+    order = np.lexsort((event_kind, event_x))
+
+    index = IntervalIndex(len(coords))
+    overlaps = []
+    for kind, rect in zip(event_kind[order].tolist(), event_rect[order].tolist()):
+        if kind == 0:
+            index.remove(rect, starts[rect], ends[rect])
+        else:
+            for other in index.overlapping(starts[rect], ends[rect]):
+                overlaps.append((min(rect, other), max(rect, other)))
+            index.add(rect, starts[rect], ends[rect])
+    overlaps.sort()
+    return LayoutReport(overlaps, out_of_bounds)
@@ -0,0 +1,85 @@
+'''
+Vectorized generation of packing workloads, and an on-disk store of them.
+
+A workload is an (n, 2) array of rect widths and heights. generate_workloads
+draws a (num_workloads, n, 2) batch, each workload from its own NumPy
+Generator spawned from the seed, so the first k workloads of a batch are
+the same for any batch size:
+
+    sizes = generate_workloads(100, 200, 'uniform', (4, 16, 4, 16), seed=1)
+
+WorkloadStore keeps the generated workloads as a .npy file named by a hash
+of the distribution, its bounds, the workload size and the seed, and
+memory maps the first num_workloads of it when asked again. A request for
+more workloads than stored generates the larger batch and replaces the
+file. Every policy and every repeated sweep packs exactly the same rects
+without generating them again.
+'''
+import hashlib
+import json
+import os
+import numpy as np
+
+def uniform_sizes(rng, low, high, shape):
+    return rng.integers(low, high + 1, size=shape)
+
+def normal_sizes(rng, low, high, shape):
+    # centered in the range, which holds +-2 standard deviations
+    sizes = rng.normal((low + high) / 2, max(high - low, 1) / 4, size=shape)
+    return np.clip(np.rint(sizes), low, high)
+
+def exponential_sizes(rng, low, high, shape):
+    # mostly small rects, a third of the range on average
+    sizes = low + rng.exponential(max(high - low, 1) / 3, size=shape)
+    return np.clip(np.rint(sizes), low, high)
+
+# name -> function(rng, low, high, shape) giving sizes in [low, high]
+DISTRIBUTIONS = {'uniform'    : uniform_sizes,
+                 'normal'     : normal_sizes,
+                 'exponential': exponential_sizes}
+
+def generate_workloads(num_workloads, num, distribution='uniform', bounds=(4, 16, 4, 16), seed=None):
+    '''
+    Returns a (num_workloads, num, 2) int32 array of widths and heights,
+    within bounds = (min width, max width, min height, max height).
+    Workload i only depends on the seed and i
+    '''
+    sample = DISTRIBUTIONS[distribution]
+    min_w, max_w, min_h, max_h = bounds
+    sizes = np.empty((num_workloads, num, 2), dtype=np.int32)
+    for i, child in enumerate(np.random.SeedSequence(seed).spawn(num_workloads)):
+        rng = np.random.default_rng(child)
+        sizes[i, :, 0] = sample(rng, min_w, max_w, num)
+        sizes[i, :, 1] = sample(rng, min_h, max_h, num)
+    return sizes
+
+class WorkloadStore:
+    '''
+    Directory of generated workload batches, read back memory mapped
+    '''
+    def __init__(self, directory='out/workloads'):
+        self.directory = directory
+
+    def path(self, num, distribution, bounds, seed):
+        key = json.dumps([distribution, list(bounds), num, seed])
+        name = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{distribution}_{num}_{name}.npy")
+
+    def get(self, num_workloads, num, distribution='uniform', bounds=(4, 16, 4, 16), seed=0):
+        '''
+        Returns the read only, memory mapped (num_workloads, num, 2) batch,
+        generating and storing it when fewer workloads are stored
+        '''
+        path = self.path(num, distribution, bounds, seed)
+        if os.path.exists(path):
+            sizes = np.load(path, mmap_mode='r')
+            if len(sizes) >= num_workloads:
+                return sizes[:num_workloads]
+
+        os.makedirs(self.directory, exist_ok=True)
+        sizes = generate_workloads(num_workloads, num, distribution, bounds, seed)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, sizes)
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode='r')